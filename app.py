@@ -1,11 +1,17 @@
+import asyncio
+import json
+import os
+import time
+
 import holoviews as hv
-import numpy as np
 import panel as pn
-import requests
-from bokeh.models import HoverTool
-from holoviews.streams import Pipe
-from modules.colors import HEADER_CL
-from modules.constants import ADMIN_BOUNDS, DASH_DESC
+from bokeh.models import CustomJSHover, HoverTool
+from holoviews.streams import Pipe, RangeX, RangeXY
+from modules.colors import HEADER_CL, TRAIL_CL
+from modules.basemap import get_level, load_admin_bounds
+from modules.constants import DASH_DESC
+from modules.delta import DeltaUpdater
+from modules.feed_cache import FEED_CACHE, STATIC_GTFS, VEHICLE_TRAILS
 from modules.indicators import (
     FLEET_IND,
     IN_TRANSIT_IND,
@@ -13,7 +19,15 @@ from modules.indicators import (
     ON_TIME_IND,
     STOPPED_IND,
 )
-from modules.rome_gtfs_rt import FULL_DF_SCHEMA, get_data
+from modules.metrics import STAGE_SECONDS, start_metrics_server, timed
+from modules.rome_gtfs_rt import (
+    DELAY_CLASSES,
+    DELAY_COLORS,
+    STATUS_CLASSES,
+    STATUS_COLORS,
+    get_spatial_index,
+)
+from modules.spatial import contains, cull, get_box
 from modules.time_utils import get_current_time
 
 # Load the bokeh extension
@@ -25,88 +39,211 @@ hv.renderer("bokeh").webgl = False  # Disable Webgl
 # Set the sizing mode
 pn.config.sizing_mode = "stretch_both"
 
+# Width (pixels) of the maps
+MAP_WIDTH = 600
+
+# Vehicles are sent to a session only within its viewport, enlarged by
+# this share of its size on each side
+VIEWPORT_MARGIN = 0.5
+
+# Points in view above which the stream layers are rasterized with datashader
+# (0: always draw vector glyphs)
+RASTERIZE_THRESHOLD = int(os.environ.get("RASTERIZE_THRESHOLD", 0))
+
+# Period (milliseconds) of the updates of the sessions
+UPDATE_PERIOD = 10000
+
+
+def get_code_formatter(labels):
+    """
+    Returns a hover formatter that shows the label of a class code
+    """
+
+    return CustomJSHover(code=f"return {json.dumps(labels)}[value];")
+
+
+def get_code_color_opts(colors):
+    """
+    Returns the color options that map the class codes to their colors
+    """
+
+    codes = sorted(colors)
+    return dict(cmap=[colors[code] for code in codes], clim=(codes[0], codes[-1]))
+
 
 def init_stream_layers():
     """
     This function initialize the stream layers
     """
 
+    route_tooltips = []
+    if STATIC_GTFS is not None:
+        route_tooltips = [("Route", "@routeName"), ("Headsign", "@headsign")]
+
     gtfs_hover = HoverTool(
         tooltips=[
             ("Vehicle ID", "@vehicleID"),
+            *route_tooltips,
             ("Trip ID", "@tripID"),
             ("Start Time", "@startTime"),
             ("Last Update", "@lastUpdate"),
             ("Delay (min)", "@delay"),
-            ("Delay Class", "@delayClass"),
-            ("Vehicle Status", "@currentStatusClass"),
-        ]
+            ("Next Stop Delay (min)", "@nextStopDelay"),
+            ("Max Delay (min)", "@maxDelay"),
+            ("Delay Trend (min)", "@delayTrend"),
+            ("Delay Class", "@delayCode{custom}"),
+            ("Vehicle Status", "@statusCode{custom}"),
+        ],
+        formatters={
+            "@delayCode": get_code_formatter(DELAY_CLASSES),
+            "@statusCode": get_code_formatter(STATUS_CLASSES),
+        },
     )
 
+    # The CDS rows only match the snapshot rows when every point is drawn
+    status_hooks, delay_hooks = [], []
+    if not RASTERIZE_THRESHOLD:
+        status_hooks = [gtfs_updater.hook(color="statusCode")]
+        delay_hooks = [gtfs_updater.hook(color="delayCode")]
+
     status_points = hv.DynamicMap(hv.Points, streams=[gtfs_pipe])
     status_points.opts(
-        frame_width=600,
+        frame_width=MAP_WIDTH,
         frame_height=650,
         xaxis=None,
         yaxis=None,
-        color="statusColor",
+        color="statusCode",
         line_alpha=0.0,
         fill_alpha=0.6,
         size=6,
         tools=[gtfs_hover],
+        hooks=status_hooks,
+        **get_code_color_opts(STATUS_COLORS),
     )
 
     delay_points = hv.DynamicMap(hv.Points, streams=[gtfs_pipe])
     delay_points.opts(
-        frame_width=600,
+        frame_width=MAP_WIDTH,
         frame_height=650,
         xaxis=None,
         yaxis=None,
-        color="delayColor",
+        color="delayCode",
         line_alpha=0.0,
         fill_alpha=0.6,
         size=6,
         tools=[gtfs_hover],
+        hooks=delay_hooks,
+        **get_code_color_opts(DELAY_COLORS),
     )
+
+    if RASTERIZE_THRESHOLD:
+        from modules.rasterize import rasterize_when_dense
+
+        status_points = rasterize_when_dense(
+            status_points,
+            "statusCode",
+            RASTERIZE_THRESHOLD,
+            **get_code_color_opts(STATUS_COLORS),
+        )
+        delay_points = rasterize_when_dense(
+            delay_points,
+            "delayCode",
+            RASTERIZE_THRESHOLD,
+            **get_code_color_opts(DELAY_COLORS),
+        )
     return status_points, delay_points
 
 
+def init_trail_layer():
+    """
+    This function initialize the layer with the trails of the vehicles
+    """
+
+    trail_paths = hv.DynamicMap(hv.Path, streams=[trail_pipe])
+    trail_paths.opts(color=TRAIL_CL, line_alpha=0.5, line_width=1.5)
+    return trail_paths
+
+
 def get_admin_bounds():
     """
     Returns a Path plot showing the Administrative boundaries
-    of Rome.
+    of Rome, simplified according to the zoom level.
     """
 
-    admin_geojson = requests.get(ADMIN_BOUNDS).json()
+    # Loaded once per process, shared by all the sessions
+    levels = pn.state.as_cached("admin_bounds", load_admin_bounds)
 
-    paths = hv.Path([])
-    for fc in admin_geojson["features"][0]["geometry"]["coordinates"]:
-        fc_path = hv.Path((np.array(fc)[:, 0], np.array(fc)[:, 1]))
-        fc_path.opts(color="grey")
-        paths *= fc_path
-    return paths
+    def get_admin_path(x_range=None):
+        x, y = get_level(levels, x_range, MAP_WIDTH)
+        return hv.Path([{"x": x, "y": y}]).opts(color="grey")
 
+    return hv.DynamicMap(get_admin_path, streams=[RangeX()])
 
-def update_dashboard():
+
+async def update_dashboard():
     """
-    This function updates the Stream Layers and the number widgets
+    This function updates the Stream Layers and the number widgets.
+    The snapshot is read in a worker thread, so that fetching and decoding
+    the feed never blocks the event loop; only the updates of the layers
+    and widgets run on it.
     """
 
-    curr_time = get_current_time()
-    cache_bust = curr_time.split()[-1]
-    data = get_data(cache_bust)
-    if len(data):
-        # Push the data into dynamic maps
-        gtfs_pipe.send(data)
+    global tick_running
 
-        # Update the widgets
-        IN_TRANSIT_IND.value = data["currentStatus"].isin([2]).sum(axis=0)
-        STOPPED_IND.value = data["currentStatus"].isin([1]).sum(axis=0)
-        FLEET_IND.value = IN_TRANSIT_IND.value + STOPPED_IND.value
+    if tick_running:
+        # The previous tick is still running: drop this one
+        FEED_CACHE.stats["dropped_ticks"] += 1
+        return
 
-        ON_TIME_IND.value = data["delayClass"].isin(["On time"]).sum(axis=0)
-        LATE_IND.value = data["delayClass"].isin(["Late"]).sum(axis=0)
+    tick_running = True
+    try:
+        # The snapshot is shared by all the sessions
+        data, version = await asyncio.get_running_loop().run_in_executor(
+            None, FEED_CACHE.get
+        )
+        push_snapshot(data, version)
+    finally:
+        tick_running = False
 
+
+async def on_tick():
+    """
+    Periodic callback: records how late the tick runs (the delay
+    since the previous tick beyond UPDATE_PERIOD), then updates the dashboard.
+    """
+
+    global last_tick_at
+
+    now = time.monotonic()
+    if last_tick_at is not None:
+        STAGE_SECONDS.observe("tick_drift", max(now - last_tick_at - UPDATE_PERIOD / 1000, 0))
+    last_tick_at = now
+    await update_dashboard()
+
+
+def push_snapshot(data, version):
+    """
+    Pushes a snapshot into the Stream Layers and the number widgets
+    """
+
+    global last_version, latest_snapshot
+
+    if version == last_version:
+        # The feed did not change since the latest update
+        latest_update_time.value = get_current_time()
+        return
+    last_version = version
+    latest_snapshot = data
+
+    if len(data):
+        # Push the data (or only the changed rows) into dynamic maps
+        start = time.perf_counter()
+        with timed("pipe_send"):
+            gtfs_updater.send(cull_to_viewport(data))
+            trail_pipe.send([VEHICLE_TRAILS.get_paths(box=culled_box)])
+        FEED_CACHE.record_fan_out(time.perf_counter() - start)
+
+        update_indicators(data)
         latest_update_time.value = get_current_time()
         alert_pane.visible = False
     else:
@@ -114,6 +251,53 @@ def update_dashboard():
         alert_pane.visible = True
 
 
+def cull_to_viewport(data):
+    """
+    Returns the vehicles of a snapshot inside the (enlarged) viewport
+    of the session
+    """
+
+    with timed("cull"):
+        return cull(data, get_spatial_index(data), culled_box)
+
+
+def on_viewport_change(x_range, y_range):
+    """
+    Sends the vehicles of the new viewport, unless it is still inside
+    the box the vehicles were culled to (and not much smaller than it)
+    """
+
+    global culled_box
+
+    if x_range is None or y_range is None or not len(latest_snapshot):
+        return
+
+    viewport = (x_range[0], y_range[0], x_range[1], y_range[1])
+    if culled_box is not None and contains(culled_box, viewport):
+        zoomed_in = (x_range[1] - x_range[0]) * 4 < culled_box[2] - culled_box[0]
+        if not zoomed_in:
+            return
+
+    culled_box = get_box(x_range, y_range, VIEWPORT_MARGIN)
+    with timed("pipe_send"):
+        gtfs_updater.send(cull_to_viewport(latest_snapshot))
+        trail_pipe.send([VEHICLE_TRAILS.get_paths(box=culled_box)])
+
+
+def update_indicators(data):
+    """
+    Updates the number widgets
+    """
+
+    with timed("indicators"):
+        IN_TRANSIT_IND.value = data["currentStatus"].isin([2]).sum(axis=0)
+        STOPPED_IND.value = data["currentStatus"].isin([1]).sum(axis=0)
+        FLEET_IND.value = IN_TRANSIT_IND.value + STOPPED_IND.value
+
+        ON_TIME_IND.value = data["delayCode"].isin([0]).sum(axis=0)
+        LATE_IND.value = data["delayCode"].isin([1]).sum(axis=0)
+
+
 # Description pane
 desc_pane = pn.pane.HTML(
     DASH_DESC,
@@ -132,12 +316,32 @@ delay_indicators = pn.Row(ON_TIME_IND, LATE_IND)
 alert_pane = pn.pane.Alert("😿No data received from Roma mobilità!", alert_type="danger")
 alert_pane.visible = False
 
+# The first paint shows the latest snapshot of the shared cache (if any),
+# without waiting for the feed
+snapshot, snapshot_version = FEED_CACHE.latest()
+
 # Inizialize the pipe
-gtfs_pipe = Pipe(FULL_DF_SCHEMA)
+gtfs_pipe = Pipe(snapshot)
+
+# Sends the changed rows of each snapshot into the stream layers
+gtfs_updater = DeltaUpdater(gtfs_pipe)
 
 # Inizialize the stream layers
 status_points, delay_points = init_stream_layers()
 
+# Box (x0, y0, x1, y1) the vehicles sent to this session are culled to,
+# None: all the vehicles
+culled_box = None
+latest_snapshot = snapshot
+
+# Follow the viewport of the maps (their axes are linked)
+viewport_stream = RangeXY(source=status_points)
+viewport_stream.add_subscriber(on_viewport_change)
+
+# Inizialize the trail layer
+trail_pipe = Pipe([VEHICLE_TRAILS.get_paths()])
+trail_paths = init_trail_layer()
+
 # CartoLight tiles
 tiles = hv.element.tiles.CartoLight()
 
@@ -145,14 +349,34 @@ tiles = hv.element.tiles.CartoLight()
 admin_bounds = get_admin_bounds()
 
 # Stream layers
-status_map = tiles * admin_bounds * status_points
+status_map = tiles * admin_bounds * trail_paths * status_points
 delay_map = tiles * admin_bounds * delay_points
 
-# Initialize the stream layers and indicators
-update_dashboard()
+# Version of the latest snapshot pushed to this session
+last_version = None
+if len(snapshot):
+    last_version = snapshot_version
+    update_indicators(snapshot)
+    latest_update_time.value = get_current_time()
+
+# True while a tick of this session is running
+tick_running = False
+
+# Time (time.monotonic) of the latest periodic tick of this session
+last_tick_at = None
+
+# Start the shared feed poller (once per process)
+FEED_CACHE.start()
+
+# Serve the metrics (/metrics) and the profiler (/profile) on a local port
+if os.environ.get("METRICS_PORT"):
+    start_metrics_server(int(os.environ["METRICS_PORT"]))
+
+# Initialize the stream layers and indicators once the session is loaded
+pn.state.onload(update_dashboard)
 
 # Define a periodic callback that updates the stream layers and the number widgets every 10 seconds
-callback = pn.state.add_periodic_callback(callback=update_dashboard, period=10000)
+callback = pn.state.add_periodic_callback(callback=on_tick, period=UPDATE_PERIOD)
 
 # Compose the main layout
 layout = pn.Row(
@@ -167,9 +391,11 @@ layout = pn.Row(
         alert_pane,
         width=400,
     ),
+    # Only the active map is rendered
     pn.Tabs(
         ("Vehicle Status", status_map),
         ("Delays", delay_map),
+        dynamic=True,
     ),
 )
 
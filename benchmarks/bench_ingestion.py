@@ -0,0 +1,230 @@
+"""
+Benchmarks of the GTFS-RT ingestion pipeline on synthetic feeds.
+
+Times each stage (parse, decode, join, get_data, pipe send) and tracks its
+peak memory (Python allocations, as traced by tracemalloc). Also reports
+the memory of the snapshot DataFrame (memory_usage(deep=True)) and the
+size of the messages sent to the browser when the stream layer moves to
+the next frame, through a full pipe send and through the DeltaUpdater
+patches. With --compare, exits with an error if a stage got slower (or a
+size larger) than the baseline by more than --threshold.
+
+    python -m benchmarks.bench_ingestion --save baseline.json
+    python -m benchmarks.bench_ingestion --compare baseline.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from google.transit import gtfs_realtime_pb2
+from modules import rome_gtfs_rt
+from modules.gtfs_rt_core import SnapshotJoiner, decode_snapshot
+
+from benchmarks.stub_feed import make_frames
+from benchmarks.synthetic import MemorySource, make_feeds
+
+SIZES = [1000, 5000, 20000, 100000]
+
+
+def parse(payload):
+    feed_message = gtfs_realtime_pb2.FeedMessage()
+    feed_message.ParseFromString(payload)
+    return feed_message
+
+
+def measure(function, repeat):
+    """
+    Returns the median time (seconds) and the peak memory (bytes) of a stage.
+    """
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"median": statistics.median(timings), "peak": peak}
+
+
+def get_pipe_send():
+    """
+    Returns a function that pushes a snapshot into a rendered stream layer,
+    or None if HoloViews is not available.
+    """
+
+    try:
+        import holoviews as hv
+        from holoviews.streams import Pipe
+    except ImportError:
+        return None
+
+    hv.extension("bokeh")
+    pipe = Pipe(rome_gtfs_rt.FULL_DF_SCHEMA)
+    points = hv.DynamicMap(hv.Points, streams=[pipe])
+    hv.renderer("bokeh").get_plot(points)
+    return pipe.send
+
+
+def get_stages(n_vehicles, pipe_send):
+    """
+    Returns the benchmarked stages for a feed of `n_vehicles` vehicles.
+    """
+
+    vehicle_payload, trip_payload = make_feeds(n_vehicles)
+    vehicle_feed = parse(vehicle_payload)
+    trip_feed = parse(trip_payload)
+    vehicle_data = rome_gtfs_rt.decode_vehicle_feed(vehicle_feed)
+    delay_data = rome_gtfs_rt.decode_delay_feed(trip_feed)
+    delay_index = rome_gtfs_rt.DelayIndex()
+    delay_index.update(delay_data)
+    full_data = delay_index.join(vehicle_data)
+    source = MemorySource(vehicle_payload, trip_payload)
+
+    stages = {
+        "parse_vehicle": lambda: parse(vehicle_payload),
+        "decode_vehicle": lambda: rome_gtfs_rt.decode_vehicle_feed(vehicle_feed),
+        "get_vehicle_data": lambda: rome_gtfs_rt.get_vehicle_data(source),
+        "parse_trip": lambda: parse(trip_payload),
+        "decode_trip": lambda: rome_gtfs_rt.decode_delay_feed(trip_feed),
+        "get_delay_data": lambda: rome_gtfs_rt.get_delay_data(source),
+        # Per-tick DataFrame merge vs persistent tripID index
+        "merge": lambda: vehicle_data.merge(delay_data, on="tripID"),
+        "join_index_update": lambda: delay_index.update(delay_data),
+        "join_index": lambda: delay_index.join(vehicle_data, how="inner"),
+        "join_index_left": lambda: delay_index.join(vehicle_data, how="left"),
+        "get_data": lambda: rome_gtfs_rt.get_data(source),
+    }
+    if pipe_send is not None:
+        stages["pipe_send"] = lambda: pipe_send(full_data)
+    return stages
+
+
+def get_message_size(previous, current, delta):
+    """
+    Returns the size (bytes) of the PATCH-DOC messages sent to the browser
+    when a rendered stream layer moves from the `previous` to the `current`
+    snapshot, through the DeltaUpdater (`delta`) or a full pipe send.
+    """
+
+    import holoviews as hv
+    from bokeh.document import Document
+    from bokeh.protocol import Protocol
+    from holoviews.streams import Pipe
+    from modules.delta import DeltaUpdater
+
+    pipe = Pipe(previous)
+    updater = DeltaUpdater(pipe)
+    # The hover tool of the dashboard layers puts every column in their CDS
+    points = hv.DynamicMap(hv.Points, streams=[pipe]).opts(tools=["hover"], hooks=[updater.hook()])
+    document = Document()
+    document.add_root(hv.renderer("bokeh").get_plot(points, doc=document).state)
+
+    events = []
+    document.on_change(events.append)
+    if delta:
+        updater.send(current)
+    else:
+        pipe.send(current)
+
+    size = 0
+    for event in events:
+        message = Protocol().create("PATCH-DOC", [event])
+        size += len(message.content_json) + sum(len(buffer.to_bytes()) for buffer in message.buffers)
+    return size
+
+
+def get_sizes(n_vehicles, pipe_send):
+    """
+    Returns the sizes (bytes) of the snapshot and of the messages sent to
+    the browser for two consecutive frames of `n_vehicles` vehicles.
+    """
+
+    joiner = SnapshotJoiner()
+    previous, current = (
+        decode_snapshot(joiner, vehicle_payload, trip_payload, rome_gtfs_rt.JOIN_HOW)
+        for vehicle_payload, trip_payload in make_frames(n_vehicles, 2)
+    )
+
+    sizes = {"snapshot_memory": current.memory_usage(deep=True).sum()}
+    if pipe_send is not None:
+        sizes["bokeh_full_send"] = get_message_size(previous, current, delta=False)
+        sizes["bokeh_patch"] = get_message_size(previous, current, delta=True)
+    return sizes
+
+
+def run(sizes, repeat):
+    pipe_send = get_pipe_send()
+
+    results = {}
+    for n_vehicles in sizes:
+        results[str(n_vehicles)] = {}
+        for stage, function in get_stages(n_vehicles, pipe_send).items():
+            result = measure(function, repeat)
+            results[str(n_vehicles)][stage] = result
+            print(
+                f"{n_vehicles:>7} {stage:<18} "
+                f"{result['median'] * 1000:>10.2f} ms {result['peak'] / 1e6:>10.2f} MB"
+            )
+        for stage, size in get_sizes(n_vehicles, pipe_send).items():
+            results[str(n_vehicles)][stage] = {"bytes": int(size)}
+            print(f"{n_vehicles:>7} {stage:<18} {size / 1e3:>10.1f} kB")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the stages slower (or larger) than the baseline by more than
+    `threshold`: (size, stage, metric, before, after).
+    """
+
+    regressions = []
+    for size, stages in results.items():
+        for stage, result in stages.items():
+            reference = baseline.get(size, {}).get(stage, {})
+            for metric in ("median", "bytes"):
+                if metric not in result or not reference.get(metric):
+                    continue
+                if result[metric] > reference[metric] * (1 + threshold):
+                    regressions.append((size, stage, metric, reference[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for size, stage, metric, before, after in regressions:
+            if metric == "bytes":
+                print(f"REGRESSION {size} {stage}: {before / 1e3:.1f} kB -> {after / 1e3:.1f} kB")
+            else:
+                print(f"REGRESSION {size} {stage}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
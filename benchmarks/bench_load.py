@@ -0,0 +1,278 @@
+"""
+Load test of the dashboard with many concurrent sessions, fully offline.
+
+Serves app.py with `panel serve` on the stub GTFS-RT server
+(benchmarks/stub_feed.py), then opens more and more headless Bokeh
+websocket sessions. For each number of sessions, reports over --duration
+seconds:
+
+- the drift of the periodic callbacks (delay of the ticks beyond their
+  period, mean and 95th percentile, from the tick_drift stage of /metrics)
+  and the ticks dropped because the previous one was still running;
+- the websocket bytes received per session and per tick;
+- the CPU usage and the RSS of the server process (read from /proc, Linux).
+
+    python -m benchmarks.bench_load --sessions 1 10 50 100 --duration 60 --report load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from bokeh.document import Document
+from bokeh.document.events import MessageSentEvent
+from bokeh.events import DocumentReady
+from bokeh.protocol import Protocol
+from bokeh.util.token import generate_jwt_token, generate_session_id
+from tornado.httpclient import AsyncHTTPClient
+from tornado.websocket import websocket_connect
+
+from benchmarks.stub_feed import StubFeedServer, make_frames
+
+# Period (seconds) of the feed and of the updates of the sessions (see app.py)
+PERIOD = 10
+
+# Max size (bytes) of the messages of the server (the first one holds the document)
+MAX_MESSAGE_SIZE = 100 * 1024 * 1024
+
+# Metrics line of the histogram of a stage: (suffix, le, value)
+METRIC_LINE = re.compile(
+    r'rome_in_transit_stage_seconds_(bucket|sum|count)\{stage="tick_drift"(?:,le="([^"]+)")?\} (\S+)'
+)
+
+
+class HeadlessSession:
+    """
+    A Bokeh session without browser: pulls the document and reports it
+    ready like BokehJS does (Panel holds the updates of the plots until
+    then), then only counts the messages and bytes pushed by the server.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.socket = None
+        self.bytes = 0
+        self.messages = {}
+
+    async def open(self):
+        token = generate_jwt_token(generate_session_id())
+        self.socket = await websocket_connect(
+            self.url, subprotocols=["bokeh", token], max_message_size=MAX_MESSAGE_SIZE
+        )
+        await self.read_message()  # ACK
+        await self.send(Protocol().create("PULL-DOC-REQ"))
+        await self.read_message()  # PULL-DOC-REPLY
+        ready = MessageSentEvent(Document(), "bokeh_event", DocumentReady())
+        await self.send(Protocol().create("PATCH-DOC", [ready]))
+        asyncio.get_running_loop().create_task(self.read_forever())
+
+    async def send(self, message):
+        for frame in (message.header_json, message.metadata_json, message.content_json):
+            await self.socket.write_message(frame)
+
+    async def read_frame(self):
+        frame = await self.socket.read_message()
+        if frame is None:
+            raise ConnectionError("Session closed by the server")
+        self.bytes += len(frame)
+        return frame
+
+    async def read_message(self):
+        """
+        Reads a message (header, metadata, content and buffers frames),
+        returns its type.
+        """
+
+        header = json.loads(await self.read_frame())
+        for _ in range(2 + 2 * header.get("num_buffers", 0)):
+            await self.read_frame()
+        msgtype = header["msgtype"]
+        self.messages[msgtype] = self.messages.get(msgtype, 0) + 1
+        return msgtype
+
+    async def read_forever(self):
+        try:
+            while True:
+                await self.read_message()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+
+
+def get_process_stats(pid):
+    """
+    Returns the CPU time (seconds) and the RSS (bytes) of a process.
+    """
+
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu_time = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu_time, rss
+
+
+async def get_drift(metrics_url):
+    """
+    Returns the tick_drift histogram of the server: ({le: count}, sum, count),
+    and the dropped ticks.
+    """
+
+    response = await AsyncHTTPClient().fetch(metrics_url)
+    text = response.body.decode()
+    buckets, total, count = {}, 0.0, 0
+    for suffix, bound, value in METRIC_LINE.findall(text):
+        if suffix == "bucket":
+            buckets[float(bound)] = int(value)
+        elif suffix == "sum":
+            total = float(value)
+        else:
+            count = int(value)
+    dropped = re.search(r"rome_in_transit_feed_cache_dropped_ticks (\S+)", text)
+    return buckets, total, count, int(dropped.group(1)) if dropped else 0
+
+
+def get_quantile(start_buckets, end_buckets, quantile):
+    """
+    Returns the upper bound of the bucket holding a quantile of the
+    observations recorded between two scrapes of a histogram.
+    """
+
+    counts = {
+        bound: count - start_buckets.get(bound, 0) for bound, count in sorted(end_buckets.items())
+    }
+    total = counts.get(float("inf"), 0)
+    if not total:
+        return 0.0
+    for bound, count in counts.items():
+        if count >= quantile * total:
+            return bound
+    return float("inf")
+
+
+async def wait_for_server(url, timeout=120):
+    """
+    Waits for the server to accept connections. A HEAD request is used:
+    a GET would create a session that never connects.
+    """
+
+    start = time.monotonic()
+    while True:
+        try:
+            await AsyncHTTPClient().fetch(url, method="HEAD", raise_error=False)
+            return
+        except (ConnectionError, OSError):
+            if time.monotonic() - start > timeout:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run_steps(pid, app_url, metrics_url, steps, duration):
+    """
+    Opens the sessions of each step and measures the server for `duration` seconds.
+    """
+
+    ws_url = app_url.replace("http://", "ws://") + "/ws"
+    sessions = []
+    report = []
+    try:
+        for n_sessions in steps:
+            while len(sessions) < n_sessions:
+                session = HeadlessSession(ws_url)
+                await session.open()
+                sessions.append(session)
+            # Let the new sessions reach their periodic ticks
+            await asyncio.sleep(PERIOD)
+
+            start_drift = await get_drift(metrics_url)
+            start_bytes = sum(session.bytes for session in sessions)
+            start_cpu, _ = get_process_stats(pid)
+            start = time.monotonic()
+
+            await asyncio.sleep(duration)
+
+            end_drift = await get_drift(metrics_url)
+            elapsed = time.monotonic() - start
+            end_cpu, rss = get_process_stats(pid)
+            received = sum(session.bytes for session in sessions) - start_bytes
+
+            ticks = end_drift[2] - start_drift[2]
+            result = {
+                "sessions": n_sessions,
+                "ticks": ticks,
+                "drift_mean": (end_drift[1] - start_drift[1]) / ticks if ticks else 0.0,
+                "drift_p95": get_quantile(start_drift[0], end_drift[0], 0.95),
+                "dropped_ticks": end_drift[3] - start_drift[3],
+                "bytes_per_session_tick": received / n_sessions / (elapsed / PERIOD),
+                "cpu": (end_cpu - start_cpu) / elapsed,
+                "rss": rss,
+            }
+            report.append(result)
+            print(
+                f"{n_sessions:>6} sessions {ticks:>6} ticks "
+                f"drift {result['drift_mean'] * 1000:>8.1f} ms (p95 <= {result['drift_p95']:g} s) "
+                f"dropped {result['dropped_ticks']:>4} "
+                f"{result['bytes_per_session_tick'] / 1e3:>9.1f} kB/session/tick "
+                f"cpu {result['cpu'] * 100:>6.1f}% rss {rss / 1e6:>8.1f} MB",
+                flush=True,
+            )
+    finally:
+        for session in sessions:
+            session.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--duration", type=float, default=60, help="seconds per step")
+    parser.add_argument("--vehicles", type=int, default=5000)
+    parser.add_argument("--frames", type=int, default=12)
+    parser.add_argument("--port", type=int, default=5098)
+    parser.add_argument("--metrics-port", type=int, default=9198)
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--report", help="write the report (JSON) to this path")
+    args = parser.parse_args()
+
+    stub = StubFeedServer(make_frames(args.vehicles, args.frames, PERIOD), PERIOD)
+    stub.start()
+    vehicle_url, trip_url = stub.get_urls()
+
+    command = [sys.executable, "-m", "panel", "serve", args.app, "--port", str(args.port)]
+    env = dict(
+        os.environ,
+        GTFS_RT_VEHICLE_URL=vehicle_url,
+        GTFS_RT_TRIP_URL=trip_url,
+        METRICS_PORT=str(args.metrics_port),
+    )
+    app_url = f"http://localhost:{args.port}/{os.path.splitext(os.path.basename(args.app))[0]}"
+    metrics_url = f"http://127.0.0.1:{args.metrics_port}/metrics"
+
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+
+        async def run():
+            await wait_for_server(app_url)
+            return await run_steps(server.pid, app_url, metrics_url, args.sessions, args.duration)
+
+        report = asyncio.run(run())
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"stub feed: {stub.stats['requests']} requests, {stub.stats['not_modified']} not modified")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"vehicles": args.vehicles, "steps": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmarks of the reprojection of the vehicle positions to Web Mercator.
+
+Times the NumPy (closed-form) and pyproj batch projections, and pyproj
+called once per point, and checks the NumPy projection against pyproj:
+exits with an error if they differ by --tolerance meters or more.
+
+    python -m benchmarks.bench_projection --sizes 10000 100000
+"""
+
+import argparse
+import subprocess
+import sys
+
+import numpy as np
+from modules.projection import get_transformer, lonlat_to_web_mercator, to_web_mercator
+
+from benchmarks.bench_ingestion import measure
+
+# Extent (EPSG:4326) of the Metropolitan City of Rome Capital
+ROME_LONLAT = (11.9, 41.6, 13.0, 42.2)
+
+# Web Mercator bounds (EPSG:4326)
+WORLD_LONLAT = (-180.0, -85.06, 180.0, 85.06)
+
+
+def get_points(n_points, extent, seed=0):
+    rng = np.random.default_rng(seed)
+    return (
+        rng.uniform(extent[0], extent[2], n_points),
+        rng.uniform(extent[1], extent[3], n_points),
+    )
+
+
+def get_error(n_points, extent):
+    """
+    Returns the max distance (meters) between the NumPy and pyproj projections.
+    """
+
+    longitudes, latitudes = get_points(n_points, extent)
+    x, y = lonlat_to_web_mercator(longitudes, latitudes)
+    expected_x, expected_y = to_web_mercator(longitudes, latitudes, "pyproj")
+    return np.hypot(x - expected_x, y - expected_y).max()
+
+
+def get_load_time():
+    """
+    Returns the time (seconds) to import pyproj and create the transformer,
+    in a new interpreter.
+    """
+
+    code = (
+        "import time; start = time.perf_counter(); "
+        "from modules.projection import get_transformer; get_transformer(); "
+        "print(time.perf_counter() - start)"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, check=True, text=True)
+    return float(output.stdout)
+
+
+def get_stages(n_points):
+    longitudes, latitudes = get_points(n_points, ROME_LONLAT)
+    transformer = get_transformer()
+
+    def per_point():
+        return [transformer.transform(lon, lat) for lon, lat in zip(longitudes, latitudes)]
+
+    return {
+        "numpy": lambda: to_web_mercator(longitudes, latitudes, "numpy"),
+        "pyproj": lambda: to_web_mercator(longitudes, latitudes, "pyproj"),
+        "pyproj_per_point": per_point,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    print(f"{'pyproj_load':<28} {get_load_time() * 1000:>10.1f} ms")
+
+    failed = False
+    for n_points in args.sizes:
+        for stage, function in get_stages(n_points).items():
+            result = measure(function, args.repeat)
+            print(
+                f"{n_points:>7} {stage:<20} "
+                f"{result['median'] * 1000:>10.3f} ms {result['peak'] / 1e6:>10.2f} MB"
+            )
+        for name, extent in (("rome", ROME_LONLAT), ("world", WORLD_LONLAT)):
+            error = get_error(n_points, extent)
+            failed |= error >= args.tolerance
+            print(f"{n_points:>7} {'error_' + name:<20} {error * 1000:>10.6f} mm")
+    if failed:
+        sys.exit(f"NumPy projection differs from pyproj by {args.tolerance} m or more")
+
+
+if __name__ == "__main__":
+    main()
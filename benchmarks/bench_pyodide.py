@@ -0,0 +1,83 @@
+"""
+Per-tick benchmark of the browser build (modules_pyodide) in Node-based Pyodide.
+
+Serves synthetic feeds, the modules of the browser build (modules_pyodide
+and SHARED_MODULES) and the wheels over a local HTTP server and runs benchmarks/pyodide_tick.mjs, which times the
+fetch (both feeds, concurrently) and decode stages of each tick.
+Requires Node.js and the pyodide npm package (npm install pyodide@0.23.0).
+
+    python -m benchmarks.bench_pyodide --vehicles 2500 --ticks 10
+"""
+
+import argparse
+import functools
+import glob
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import make_feeds
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules of the server app loaded by the browser build (as in docs/gtfs-rt/app.js)
+SHARED_MODULES = ["colors.py", "gtfs_rt_core.py", "projection.py", "time_utils.py"]
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def prepare(path, n_vehicles):
+    """
+    Writes the files served to the benchmark into a directory.
+    """
+
+    vehicle_payload, trip_payload = make_feeds(n_vehicles)
+    with open(os.path.join(path, "vehicle_positions.pb"), "wb") as f:
+        f.write(vehicle_payload)
+    with open(os.path.join(path, "trip_updates.pb"), "wb") as f:
+        f.write(trip_payload)
+
+    for filename in glob.glob(os.path.join(ROOT, "modules_pyodide", "*.py")):
+        shutil.copy(filename, path)
+    for filename in SHARED_MODULES:
+        shutil.copy(os.path.join(ROOT, "modules", filename), path)
+    for filename in glob.glob(os.path.join(ROOT, "wheels", "*.whl")):
+        shutil.copy(filename, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vehicles", type=int, default=2500)
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--node", default="node")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        prepare(path, args.vehicles)
+
+        handler = functools.partial(QuietHandler, directory=path)
+        server = ThreadingHTTPServer(("localhost", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            subprocess.run(
+                [
+                    args.node,
+                    os.path.join(ROOT, "benchmarks", "pyodide_tick.mjs"),
+                    f"http://localhost:{server.server_port}",
+                    str(args.ticks),
+                ],
+                cwd=ROOT,
+                check=True,
+            )
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
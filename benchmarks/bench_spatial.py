@@ -0,0 +1,67 @@
+"""
+Benchmarks of the spatial index of the vehicle positions.
+
+Times the grid build and the viewport, nearest vehicle and point-in-area
+queries against a brute-force scan of all the vehicles.
+
+    python -m benchmarks.bench_spatial --sizes 5000 50000
+"""
+
+import argparse
+
+import numpy as np
+from modules.basemap import get_level, load_admin_bounds
+from modules.spatial import GridIndex, points_in_polygon
+
+from benchmarks.bench_ingestion import measure
+
+# Extent (EPSG:3857) of the Metropolitan City of Rome Capital
+ROME_EXTENT = (1.325e6, 5.105e6, 1.447e6, 5.175e6)
+
+
+def get_stages(n_vehicles, repeat_queries=100):
+    rng = np.random.default_rng(0)
+    x = rng.uniform(ROME_EXTENT[0], ROME_EXTENT[2], n_vehicles)
+    y = rng.uniform(ROME_EXTENT[1], ROME_EXTENT[3], n_vehicles)
+    index = GridIndex(x, y)
+
+    # Viewports of a 600 px wide map zoomed in on the city centre
+    center_x, center_y = 1.3895e6, 5.1525e6
+    viewport = (center_x - 3000, center_y - 3000, center_x + 3000, center_y + 3000)
+    points = rng.uniform(ROME_EXTENT[:2], ROME_EXTENT[2:], (repeat_queries, 2))
+    area_x, area_y = get_level(load_admin_bounds(), None, 600)
+
+    def brute_box():
+        x0, y0, x1, y1 = viewport
+        return np.flatnonzero((x >= x0) & (x <= x1) & (y >= y0) & (y <= y1))
+
+    return {
+        "build": lambda: GridIndex(x, y),
+        "box": lambda: index.query_box(*viewport),
+        "box_brute": brute_box,
+        f"nearest_x{repeat_queries}": lambda: [index.nearest(px, py, 5) for px, py in points],
+        f"nearest_brute_x{repeat_queries}": lambda: [
+            np.argsort(np.hypot(x - px, y - py))[:5] for px, py in points
+        ],
+        "in_area": lambda: index.query_polygon(area_x, area_y),
+        "in_area_brute": lambda: np.flatnonzero(points_in_polygon(x, y, area_x, area_y)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for n_vehicles in args.sizes:
+        for stage, function in get_stages(n_vehicles).items():
+            result = measure(function, args.repeat)
+            print(
+                f"{n_vehicles:>7} {stage:<20} "
+                f"{result['median'] * 1000:>10.3f} ms {result['peak'] / 1e6:>10.2f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Startup benchmark of the dashboard.
+
+Serves app.py with `panel serve` on a replayed synthetic feed, then opens
+consecutive sessions (pulling their document, as a browser does before
+the first paint) and reports for each one the time to the first paint
+and the vehicles it already shows.
+
+    python -m benchmarks.bench_startup --sessions 5 --vehicles 5000 [--warm]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import holoviews  # noqa: F401 (registers the models of the pulled documents)
+import panel  # noqa: F401
+import requests
+from bokeh.client import pull_session
+from bokeh.models import ColumnDataSource
+from modules.feed_archive import FeedRecorder
+
+from benchmarks.synthetic import make_feeds
+
+
+def count_vehicles(document):
+    """
+    Returns the number of vehicles drawn in a document.
+    """
+
+    return max(
+        (
+            len(source.data["vehicleID"])
+            for source in document.select({"type": ColumnDataSource})
+            if "vehicleID" in source.data
+        ),
+        default=0,
+    )
+
+
+def open_session(url):
+    """
+    Returns the time to pull the document of a new session and the
+    vehicles of its first paint.
+    """
+
+    start = time.perf_counter()
+    with pull_session(url=url) as session:
+        elapsed = time.perf_counter() - start
+        return elapsed, count_vehicles(session.document)
+
+
+def record_feed(path, n_vehicles):
+    """
+    Records a synthetic snapshot into a feed archive.
+    """
+
+    vehicle_payload, trip_payload = make_feeds(n_vehicles)
+    recorder = FeedRecorder(path)
+    fetched_at = time.time()
+    recorder.record("vehicle", vehicle_payload, fetched_at)
+    recorder.record("trip", trip_payload, fetched_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--vehicles", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--warm", action="store_true", help="panel serve --warm")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as archive:
+        record_feed(archive, args.vehicles)
+
+        command = [sys.executable, "-m", "panel", "serve", args.app, "--port", str(args.port)]
+        if args.warm:
+            command.append("--warm")
+        env = dict(os.environ, GTFS_RT_REPLAY=archive)
+        url = f"http://localhost:{args.port}/{os.path.splitext(os.path.basename(args.app))[0]}"
+
+        start = time.perf_counter()
+        server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    requests.head(url, timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.05)
+            print(f"server ready {(time.perf_counter() - start) * 1000:>8.1f} ms")
+
+            for session in range(args.sessions):
+                elapsed, vehicles = open_session(url)
+                print(
+                    f"session {session} first paint {elapsed * 1000:>8.1f} ms "
+                    f"{vehicles:>7} vehicles"
+                )
+                time.sleep(1)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
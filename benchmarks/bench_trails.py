@@ -0,0 +1,91 @@
+"""
+Memory check of the vehicle trails over simulated days of ticks.
+
+Appends a snapshot every 10 (simulated) seconds, with vehicles entering and
+leaving the service, and exits with an error if the memory traced after the
+first fleet shift grows by more than --tolerance bytes. The default capacity
+is smaller than two fleets, so that each shift recycles the slots of the
+vehicles that just left the service (checked too).
+
+    python -m benchmarks.bench_trails --days 2 --vehicles 1000
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from modules.trails import VehicleTrails
+
+TICK = 10
+TICKS_PER_HOUR = 3600 // TICK
+
+
+def make_snapshot(rng, tick, n_vehicles, shift_ticks):
+    """
+    Returns a snapshot of `n_vehicles` vehicles: every `shift_ticks` ticks
+    the whole fleet is replaced by new vehicles.
+    """
+
+    shift = tick // shift_ticks
+    vehicle_ids = (np.arange(n_vehicles) + shift * n_vehicles).astype(str)
+    return pd.DataFrame(
+        {
+            "vehicleID": vehicle_ids,
+            "x": rng.uniform(1.33e6, 1.45e6, n_vehicles),
+            "y": rng.uniform(5.1e6, 5.17e6, n_vehicles),
+        }
+    )
+
+
+def run(days, n_vehicles, shift_hours, length, capacity):
+    rng = np.random.default_rng(0)
+    trails = VehicleTrails(capacity=capacity, length=length)
+    shift_ticks = shift_hours * TICKS_PER_HOUR
+
+    tracemalloc.start()
+    baseline = None
+    start = time.perf_counter()
+    for tick in range(days * 24 * TICKS_PER_HOUR):
+        trails.append(make_snapshot(rng, tick, n_vehicles, shift_ticks), tick * TICK)
+        if tick == shift_ticks + TICKS_PER_HOUR:
+            baseline = tracemalloc.get_traced_memory()[0]
+        if tick % (6 * TICKS_PER_HOUR) == 0:
+            trails.get_paths()
+            print(
+                f"day {tick * TICK / 86400:>5.2f} "
+                f"traced {tracemalloc.get_traced_memory()[0] / 1e6:>8.2f} MB "
+                f"buffers {trails.nbytes() / 1e6:>8.2f} MB "
+                f"vehicles {len(trails.slots):>7}"
+            )
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    elapsed = time.perf_counter() - start
+    print(f"{trails.stats} in {elapsed:.1f} s")
+    return current - baseline, trails.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--shift-hours", type=int, default=4)
+    parser.add_argument("--length", type=int, default=20)
+    parser.add_argument("--capacity", type=int, help="default: 1.5 fleets")
+    parser.add_argument("--tolerance", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    capacity = args.capacity or args.vehicles * 3 // 2
+    growth, stats = run(args.days, args.vehicles, args.shift_hours, args.length, capacity)
+    print(f"memory growth after the first fleet shift: {growth / 1e6:.3f} MB")
+    if growth > args.tolerance:
+        sys.exit(1)
+    if capacity < 2 * args.vehicles and not stats["recycled"]:
+        sys.exit("no slot was recycled")
+
+
+if __name__ == "__main__":
+    main()
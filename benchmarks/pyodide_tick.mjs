@@ -0,0 +1,90 @@
+// Per-tick timing of the browser build (modules_pyodide) in Node-based Pyodide.
+// Run through benchmarks/bench_pyodide.py, which serves the synthetic feeds,
+// the modules and the wheels at BASE_URL:
+//
+//     npm install pyodide@0.23.0
+//     node benchmarks/pyodide_tick.mjs BASE_URL TICKS
+
+import { loadPyodide } from "pyodide";
+
+const [baseUrl, ticks = "10"] = process.argv.slice(2);
+
+const modules = [
+  "colors.py",
+  "constants.py",
+  "gtfs_rt_core.py",
+  "projection.py",
+  "time_utils.py",
+  "rome_gtfs_rt.py",
+];
+const wheels = [
+  "protobuf-4.23.3-py3-none-any.whl",
+  "gtfs_realtime_bindings-1.0.0-py3-none-any.whl",
+];
+
+const pyodide = await loadPyodide();
+await pyodide.loadPackage(["micropip", "numpy", "pandas", "pytz"]);
+
+pyodide.globals.set("wheel_urls", wheels.map((wheel) => `${baseUrl}/${wheel}`));
+await pyodide.runPythonAsync(`
+import micropip
+await micropip.install(wheel_urls.to_py())
+`);
+
+for (const module of modules) {
+  const response = await fetch(`${baseUrl}/${module}`);
+  pyodide.FS.writeFile(module, new Uint8Array(await response.arrayBuffer()));
+}
+
+pyodide.globals.set("base_url", baseUrl);
+pyodide.globals.set("ticks", Number(ticks));
+await pyodide.runPythonAsync(`
+import statistics
+import time
+
+import numpy as np
+import rome_gtfs_rt
+
+
+def x_user_defined(payload):
+    # The response text of a x-user-defined XHR
+    return "".join(chr(byte if byte < 0x80 else 0xF700 + byte) for byte in payload)
+
+
+def user_defined_to_bytes(text):
+    # Each character holds a byte in its low 8 bits
+    chars = np.frombuffer(text.encode("utf-16-le"), np.uint16)
+    return chars.astype(np.uint8).tobytes()
+
+
+def report(stage, timings):
+    print(f"{stage:<24} {statistics.median(timings) * 1000:>10.2f} ms")
+
+
+vehicle_url = f"{base_url}/vehicle_positions.pb"
+trip_url = f"{base_url}/trip_updates.pb"
+
+timings = {"fetch": [], "decode": [], "tick": [], "xhr_bytes_per_byte": [], "xhr_bytes": []}
+for _ in range(ticks):
+    start = time.perf_counter()
+    vehicle_payload, trip_payload = await rome_gtfs_rt.fetch_feeds(vehicle_url, trip_url)
+    fetched = time.perf_counter()
+    data = rome_gtfs_rt.decode_data(vehicle_payload, trip_payload)
+    decoded = time.perf_counter()
+    timings["fetch"].append(fetched - start)
+    timings["decode"].append(decoded - fetched)
+    timings["tick"].append(decoded - start)
+
+    # Conversion of the former synchronous XHR response, per byte vs vectorized
+    text = x_user_defined(vehicle_payload) + x_user_defined(trip_payload)
+    start = time.perf_counter()
+    bytes(ord(byte) & 0xFF for byte in text)
+    timings["xhr_bytes_per_byte"].append(time.perf_counter() - start)
+    start = time.perf_counter()
+    user_defined_to_bytes(text)
+    timings["xhr_bytes"].append(time.perf_counter() - start)
+
+print(f"{len(data)} vehicles, {len(vehicle_payload) + len(trip_payload)} bytes per tick")
+for stage, stage_timings in timings.items():
+    report(stage, stage_timings)
+`);
@@ -0,0 +1,152 @@
+"""
+Stub GTFS-RT server: serves synthetic vehicle positions and trip updates
+feeds over HTTP, with the vehicles moving at every period.
+
+Used by benchmarks/bench_load.py, it can also feed a local dashboard
+without network access:
+
+    python -m benchmarks.stub_feed --vehicles 5000 --port 8765
+    GTFS_RT_VEHICLE_URL=http://localhost:8765/vehicle_positions.pb \\
+    GTFS_RT_TRIP_URL=http://localhost:8765/trip_updates.pb panel serve app.py
+"""
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from google.transit import gtfs_realtime_pb2
+
+from benchmarks.synthetic import make_feeds
+
+# Paths of the feeds
+PATHS = {"/vehicle_positions.pb": 0, "/trip_updates.pb": 1}
+
+# Max step (degrees) of a vehicle between two frames (about 50 m)
+MAX_STEP = 0.0005
+
+
+def make_frames(n_vehicles, n_frames, period=10, seed=0):
+    """
+    Returns the raw (vehicle positions, trip updates) payloads of
+    `n_frames` consecutive frames of a synthetic feed, `period` seconds apart.
+    """
+
+    vehicle_payload, trip_payload = make_feeds(n_vehicles, seed=seed)
+    vehicle_feed = gtfs_realtime_pb2.FeedMessage()
+    vehicle_feed.ParseFromString(vehicle_payload)
+    trip_feed = gtfs_realtime_pb2.FeedMessage()
+    trip_feed.ParseFromString(trip_payload)
+
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n_frames):
+        steps = rng.uniform(-MAX_STEP, MAX_STEP, (n_vehicles, 2))
+        # A share of the vehicles stands still at each frame
+        steps[rng.random(n_vehicles) < 0.3] = 0
+        for entity, (step_x, step_y) in zip(vehicle_feed.entity, steps):
+            entity.vehicle.position.longitude += step_x
+            entity.vehicle.position.latitude += step_y
+            entity.vehicle.timestamp += period
+        vehicle_feed.header.timestamp += period
+        trip_feed.header.timestamp += period
+        frames.append((vehicle_feed.SerializeToString(), trip_feed.SerializeToString()))
+    return frames
+
+
+class StubFeedHandler(BaseHTTPRequestHandler):
+    """
+    Serves the current frame of the server, with an ETag (conditional
+    requests are answered with 304 while the frame is unchanged).
+    """
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        feed = PATHS.get(path)
+        if feed is None:
+            self.send_error(404)
+            return
+
+        self.server.stats["requests"] += 1
+        time.sleep(self.server.latency.get(path, 0))
+        if path in self.server.failing:
+            self.send_error(502)
+            return
+
+        frame = self.server.get_frame()
+        etag = f'"{frame}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.server.stats["not_modified"] += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        payload = self.server.frames[frame][feed]
+        self.server.stats["bytes"] += len(payload)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubFeedServer(ThreadingHTTPServer):
+    """
+    HTTP server cycling through the frames, one per `period` seconds.
+    Responses can be delayed (`latency`: seconds by path) and paths
+    can be made to fail (`failing`: paths answered with 502).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, frames, period=10, address=("localhost", 0)):
+        super().__init__(address, StubFeedHandler)
+        self.frames = frames
+        self.period = period
+        self.started_at = time.monotonic()
+        self.stats = {"requests": 0, "not_modified": 0, "bytes": 0}
+        self.latency = {}
+        self.failing = set()
+
+    def get_frame(self):
+        return int((time.monotonic() - self.started_at) // self.period) % len(self.frames)
+
+    def get_urls(self):
+        """
+        Returns the urls of the vehicle positions and trip updates feeds.
+        """
+
+        base_url = f"http://localhost:{self.server_port}"
+        return tuple(f"{base_url}{path}" for path in PATHS)
+
+    def start(self):
+        """
+        Serves the feeds in a background thread.
+        """
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vehicles", type=int, default=5000)
+    parser.add_argument("--frames", type=int, default=12)
+    parser.add_argument("--period", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    frames = make_frames(args.vehicles, args.frames, int(args.period))
+    server = StubFeedServer(frames, args.period, ("localhost", args.port))
+    for url in server.get_urls():
+        print(url)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import numpy as np
+from google.transit import gtfs_realtime_pb2
+
+# Bounding box (lon/lat) of the Metropolitan City of Rome Capital
+ROME_BBOX = (11.9, 41.6, 13.0, 42.2)
+
+
+def make_feeds(n_vehicles, seed=0, timestamp=1700000000, trip_share=0.9, max_stops=8):
+    """
+    Returns the raw (vehicle positions, trip updates) payloads of a synthetic
+    GTFS-RT feed with `n_vehicles` vehicles. Only `trip_share` of the trips
+    have a trip update, each one with 1 to `max_stops` stop time updates.
+    """
+
+    rng = np.random.default_rng(seed)
+    lons = rng.uniform(ROME_BBOX[0], ROME_BBOX[2], n_vehicles)
+    lats = rng.uniform(ROME_BBOX[1], ROME_BBOX[3], n_vehicles)
+    ages = rng.integers(0, 60, n_vehicles)
+    statuses = rng.integers(0, 3, n_vehicles)
+    has_update = rng.random(n_vehicles) < trip_share
+    n_stops = rng.integers(1, max_stops + 1, n_vehicles)
+    delays = rng.normal(120, 300, (n_vehicles, max_stops)).astype(int)
+
+    vehicle_feed = gtfs_realtime_pb2.FeedMessage()
+    vehicle_feed.header.gtfs_realtime_version = "2.0"
+    vehicle_feed.header.timestamp = timestamp
+
+    trip_feed = gtfs_realtime_pb2.FeedMessage()
+    trip_feed.header.gtfs_realtime_version = "2.0"
+    trip_feed.header.timestamp = timestamp
+
+    for i in range(n_vehicles):
+        trip_id = f"0#{i}-{seed}"
+
+        entity = vehicle_feed.entity.add()
+        entity.id = str(i)
+        vehicle = entity.vehicle
+        vehicle.vehicle.id = str(5000 + i)
+        vehicle.trip.trip_id = trip_id
+        vehicle.trip.start_time = "08:00:00"
+        vehicle.position.longitude = lons[i]
+        vehicle.position.latitude = lats[i]
+        vehicle.timestamp = timestamp - int(ages[i])
+        vehicle.current_status = int(statuses[i])
+
+        if not has_update[i]:
+            continue
+        entity = trip_feed.entity.add()
+        entity.id = str(i)
+        entity.trip_update.trip.trip_id = trip_id
+        for stop in range(n_stops[i]):
+            stop_time_update = entity.trip_update.stop_time_update.add()
+            stop_time_update.stop_sequence = stop + 1
+            stop_time_update.stop_id = str(70000 + stop)
+            stop_time_update.arrival.delay = int(delays[i, stop])
+            stop_time_update.departure.delay = int(delays[i, stop])
+
+    return vehicle_feed.SerializeToString(), trip_feed.SerializeToString()
+
+
+class MemorySource:
+    """
+    A feed source (see rome_gtfs_rt.get_data) that always returns
+    the same in-memory payloads.
+    """
+
+    def __init__(self, vehicle_payload, trip_payload):
+        self.payloads = {"vehicle": vehicle_payload, "trip": trip_payload}
+
+    def read(self, feed):
+        return self.payloads[feed]
+
+    def invalidate(self, feed):
+        pass
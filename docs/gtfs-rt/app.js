@@ -1,11 +1,21 @@
 importScripts("https://cdn.jsdelivr.net/pyodide/v0.23.0/full/pyodide.js");
 
 function sendPatch(patch, buffers, msg_id) {
+  // Transfer the binary columns (x/y, status/delay codes) instead of copying them
+  const wasm_memory = self.pyodide._module.HEAPU8.buffer
+  const transfer = []
+  const values = buffers instanceof Map ? buffers.values() : Object.values(buffers || {})
+  for (const value of values) {
+    const buffer = value instanceof ArrayBuffer ? value : value && value.buffer
+    if (buffer instanceof ArrayBuffer && buffer !== wasm_memory && !transfer.includes(buffer)) {
+      transfer.push(buffer)
+    }
+  }
   self.postMessage({
     type: 'patch',
     patch: patch,
     buffers: buffers
-  })
+  }, transfer)
 }
 
 async function startApplication() {
@@ -15,7 +25,7 @@ async function startApplication() {
   self.pyodide.globals.set("sendPatch", sendPatch);
   console.log("Loaded!");
   await self.pyodide.loadPackage("micropip");
-  const env_spec = ['markdown-it-py<3', 'https://cdn.holoviz.org/panel/1.1.0/dist/wheels/bokeh-3.1.1-py3-none-any.whl', 'https://cdn.holoviz.org/panel/1.1.0/dist/wheels/panel-1.1.0-py3-none-any.whl', 'pyodide-http==0.2.1', 'holoviews>=1.15.4', 'holoviews', 'numpy', 'requests',  'pandas', 'pyproj', 'https://cdn.jsdelivr.net/gh/ivandorte/Rome-in-transit@main/wheels/gtfs_realtime_bindings-1.0.0-py3-none-any.whl', 'https://cdn.jsdelivr.net/gh/ivandorte/Rome-in-transit@main/wheels/protobuf-4.23.3-py3-none-any.whl', 'https://cdn.jsdelivr.net/gh/ivandorte/Rome-in-transit@main/wheels/pytz-2023.3-py2.py3-none-any.whl']
+  const env_spec = ['markdown-it-py<3', 'https://cdn.holoviz.org/panel/1.1.0/dist/wheels/bokeh-3.1.1-py3-none-any.whl', 'https://cdn.holoviz.org/panel/1.1.0/dist/wheels/panel-1.1.0-py3-none-any.whl', 'pyodide-http==0.2.1', 'holoviews>=1.15.4', 'holoviews', 'numpy', 'requests',  'pandas', 'https://cdn.jsdelivr.net/gh/ivandorte/Rome-in-transit@main/wheels/gtfs_realtime_bindings-1.0.0-py3-none-any.whl', 'https://cdn.jsdelivr.net/gh/ivandorte/Rome-in-transit@main/wheels/protobuf-4.23.3-py3-none-any.whl', 'https://cdn.jsdelivr.net/gh/ivandorte/Rome-in-transit@main/wheels/pytz-2023.3-py2.py3-none-any.whl']
   for (const pkg of env_spec) {
     let pkg_name;
     if (pkg.endsWith('.whl')) {
@@ -39,7 +49,7 @@ async function startApplication() {
   }
 
   // Load custom Python modules
-  const custom_modules = ['https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules_pyodide/colors.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules_pyodide/constants.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules_pyodide/indicators.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules_pyodide/rome_gtfs_rt.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules_pyodide/time_utils.py']
+  const custom_modules = ['https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules/colors.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules/gtfs_rt_core.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules/projection.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules/time_utils.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules_pyodide/constants.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules_pyodide/indicators.py', 'https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/modules_pyodide/rome_gtfs_rt.py']
   for (const module of custom_modules) {
     let module_name;
     module_name = module.split('/').slice(-1)[0]
@@ -62,11 +72,12 @@ from panel.io.pyodide import init_doc, write_doc
 init_doc()
 
 import json
+import time
 import holoviews as hv
 import numpy as np
 import panel as pn
 import requests
-from bokeh.models import HoverTool
+from bokeh.models import CustomJSHover, HoverTool
 from holoviews.streams import Pipe
 from colors import HEADER_CL
 from constants import ADMIN_BOUNDS, DASH_DESC
@@ -77,8 +88,17 @@ from indicators import (
     ON_TIME_IND,
     STOPPED_IND,
 )
-from rome_gtfs_rt import FULL_DF_SCHEMA, get_data
+from rome_gtfs_rt import (
+    DELAY_CLASSES,
+    DELAY_COLORS,
+    FULL_DF_SCHEMA,
+    STATUS_CLASSES,
+    STATUS_COLORS,
+    get_data,
+)
 from time_utils import get_current_time
+from js import Object, postMessage
+from pyodide.ffi import to_js
 from pyodide.http import open_url
 
 # Load the bokeh extension
@@ -91,6 +111,23 @@ hv.renderer("bokeh").webgl = False  # Disable Webgl
 pn.config.sizing_mode = "stretch_both"
 
 
+def get_code_formatter(labels):
+    """
+    Returns a hover formatter that shows the label of a class code
+    """
+
+    return CustomJSHover(code=f"return {json.dumps(labels)}[value];")
+
+
+def get_code_color_opts(colors):
+    """
+    Returns the color options that map the class codes to their colors
+    """
+
+    codes = sorted(colors)
+    return dict(cmap=[colors[code] for code in codes], clim=(codes[0], codes[-1]))
+
+
 def init_stream_layers():
     """
     This function initialize the stream layers
@@ -103,9 +140,13 @@ def init_stream_layers():
             ("Start Time", "@startTime"),
             ("Last Update", "@lastUpdate"),
             ("Delay (min)", "@delay"),
-            ("Delay Class", "@delayClass"),
-            ("Vehicle Status", "@currentStatusClass"),
-        ]
+            ("Delay Class", "@delayCode{custom}"),
+            ("Vehicle Status", "@statusCode{custom}"),
+        ],
+        formatters={
+            "@delayCode": get_code_formatter(DELAY_CLASSES),
+            "@statusCode": get_code_formatter(STATUS_CLASSES),
+        },
     )
 
     status_points = hv.DynamicMap(hv.Points, streams=[gtfs_pipe])
@@ -114,11 +155,12 @@ def init_stream_layers():
         frame_height=650,
         xaxis=None,
         yaxis=None,
-        color="statusColor",
+        color="statusCode",
         line_alpha=0.0,
         fill_alpha=0.6,
         size=6,
         tools=[gtfs_hover],
+        **get_code_color_opts(STATUS_COLORS),
     )
 
     delay_points = hv.DynamicMap(hv.Points, streams=[gtfs_pipe])
@@ -127,11 +169,12 @@ def init_stream_layers():
         frame_height=650,
         xaxis=None,
         yaxis=None,
-        color="delayColor",
+        color="delayCode",
         line_alpha=0.0,
         fill_alpha=0.6,
         size=6,
         tools=[gtfs_hover],
+        **get_code_color_opts(DELAY_COLORS),
     )
     return status_points, delay_points
 
@@ -153,14 +196,16 @@ def get_admin_bounds():
     return paths
 
 
-def update_dashboard():
+async def update_dashboard():
     """
-    This function updates the Stream Layers and the number widgets
+    This function updates the Stream Layers and the number widgets.
+    Both feeds are fetched concurrently, without blocking.
     """
 
+    start = time.perf_counter()
     curr_time = get_current_time()
     cache_bust = curr_time.split()[-1]
-    data = get_data(cache_bust)
+    data = await get_data(cache_bust)
     if len(data):
         # Push the data into dynamic maps
         gtfs_pipe.send(data)
@@ -170,8 +215,8 @@ def update_dashboard():
         STOPPED_IND.value = data["currentStatus"].isin([1]).sum(axis=0)
         FLEET_IND.value = IN_TRANSIT_IND.value + STOPPED_IND.value
 
-        ON_TIME_IND.value = data["delayClass"].isin(["On time"]).sum(axis=0)
-        LATE_IND.value = data["delayClass"].isin(["Late"]).sum(axis=0)
+        ON_TIME_IND.value = data["delayCode"].isin([0]).sum(axis=0)
+        LATE_IND.value = data["delayCode"].isin([1]).sum(axis=0)
 
         latest_update_time.value = get_current_time()
         alert_pane.visible = False
@@ -179,6 +224,10 @@ def update_dashboard():
         latest_update_time.value = get_current_time()
         alert_pane.visible = True
 
+    # Report the duration of the tick (in the worker) to the timing harness
+    tick = {"type": "tick", "worker_ms": (time.perf_counter() - start) * 1000, "vehicles": len(data)}
+    postMessage(to_js(tick, dict_converter=Object.fromEntries))
+
 
 # Description pane
 desc_pane = pn.pane.HTML(
@@ -215,7 +264,7 @@ status_map = tiles * admin_bounds * status_points
 delay_map = tiles * admin_bounds * delay_points
 
 # Initialize the stream layers and indicators
-update_dashboard()
+await update_dashboard()
 
 # Define a periodic callback that updates the stream layers and the number widgets every 10 seconds
 callback = pn.state.add_periodic_callback(callback=update_dashboard, period=10000)
@@ -0,0 +1,168 @@
+"""
+Administrative boundaries of Rome, drawn under the stream layers.
+
+The boundaries ship with the repo (data/RomeAdmin.geojson, EPSG:3857):
+they are simplified once at a few tolerances and cached in a .npz file,
+each level as a single NaN-separated path. The Docker image builds the
+cache; if it cannot be written (read-only data directory), the levels are
+kept in memory.
+
+    python -m modules.basemap  # build the cache
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+
+from modules.constants import ADMIN_BOUNDS, ADMIN_BOUNDS_CACHE
+
+logger = logging.getLogger(__name__)
+
+# Simplification tolerances (meters), 0: the original geometry
+TOLERANCES = (0, 10, 50, 200)
+
+
+def simplify(coords, tolerance):
+    """
+    Simplifies a line (N x 2 array) with the Douglas-Peucker algorithm.
+    """
+
+    if tolerance <= 0 or len(coords) < 3:
+        return coords
+
+    keep = np.zeros(len(coords), bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = coords[first], coords[last]
+        points = coords[first + 1 : last] - start
+        segment = end - start
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(points[:, 0], points[:, 1])
+        else:
+            cross = segment[0] * points[:, 1] - segment[1] * points[:, 0]
+            distances = np.abs(cross) / length
+        farthest = np.argmax(distances)
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack += [(first, middle), (middle, last)]
+    return coords[keep]
+
+
+def get_lines(geojson):
+    """
+    Returns the lines (N x 2 arrays) of the geometries of a GeoJSON.
+    """
+
+    lines = []
+    for feature in geojson["features"]:
+        geometry = feature["geometry"]
+        if geometry["type"] in ("LineString", "Polygon", "MultiLineString"):
+            parts = [geometry["coordinates"]]
+        else:
+            parts = geometry["coordinates"]
+        if geometry["type"] == "LineString":
+            parts = [parts]
+        for part in parts:
+            lines += [np.asarray(line, float)[:, :2] for line in part]
+    return lines
+
+
+def join_lines(lines):
+    """
+    Joins the lines into a single NaN-separated path.
+    """
+
+    gap = np.full((1, 2), np.nan)
+    path = np.concatenate([array for line in lines for array in (line, gap)])
+    return path[:, 0], path[:, 1]
+
+
+def simplify_bounds(geojson_path=ADMIN_BOUNDS):
+    """
+    Returns the boundaries simplified at each tolerance, as {tolerance: (x, y)}.
+    """
+
+    with open(geojson_path) as f:
+        lines = get_lines(json.load(f))
+
+    return {
+        tolerance: join_lines([simplify(line, tolerance) for line in lines])
+        for tolerance in TOLERANCES
+    }
+
+
+def save_cache(levels, cache_path=ADMIN_BOUNDS_CACHE):
+    """
+    Saves the simplified boundaries to the cache.
+    """
+
+    arrays = {}
+    for tolerance, (x, y) in levels.items():
+        arrays[f"x_{tolerance}"] = x
+        arrays[f"y_{tolerance}"] = y
+
+    # Write then rename, so that a concurrent reader never sees a partial file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp.npz"
+    try:
+        np.savez(tmp_path, tolerances=np.array(TOLERANCES), **arrays)
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def build_cache(geojson_path=ADMIN_BOUNDS, cache_path=ADMIN_BOUNDS_CACHE):
+    """
+    Simplifies the boundaries at each tolerance and saves them to the cache.
+    """
+
+    save_cache(simplify_bounds(geojson_path), cache_path)
+
+
+def load_admin_bounds(geojson_path=ADMIN_BOUNDS, cache_path=ADMIN_BOUNDS_CACHE):
+    """
+    Returns the boundaries as {tolerance: (x, y)}, (re)building the cache
+    if it is missing or older than the GeoJSON. If the cache cannot be
+    written, the simplified levels are only kept in memory.
+    """
+
+    if not os.path.exists(cache_path) or (
+        os.path.getmtime(cache_path) < os.path.getmtime(geojson_path)
+    ):
+        levels = simplify_bounds(geojson_path)
+        try:
+            save_cache(levels, cache_path)
+        except OSError as error:
+            logger.warning("Unable to write the admin boundaries cache: %s", error)
+        return levels
+
+    with np.load(cache_path) as cache:
+        return {
+            int(tolerance): (cache[f"x_{tolerance}"], cache[f"y_{tolerance}"])
+            for tolerance in cache["tolerances"]
+        }
+
+
+def get_level(levels, x_range, width):
+    """
+    Returns the coarsest level whose tolerance is below the size of a pixel,
+    for a view of `width` pixels over `x_range` (None: the whole boundaries).
+    """
+
+    if x_range is None:
+        x_range = (np.nanmin(levels[0][0]), np.nanmax(levels[0][0]))
+    pixel_size = (x_range[1] - x_range[0]) / width
+    tolerance = max(t for t in levels if t <= max(pixel_size, 0))
+    return levels[tolerance]
+
+
+if __name__ == "__main__":
+    build_cache()
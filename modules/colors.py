@@ -8,3 +8,7 @@ STOPPED_CL = "#EE7733"
 # Delay class colors
 ON_TIME_CL = "#009988"
 LATE_CL = "#CC3311"
+UNKNOWN_CL = "#BBBBBB"
+
+# Vehicle trail color
+TRAIL_CL = "#0077BB"
@@ -1,11 +1,25 @@
+import os
+
 # Roma mobilità - GTFS-RT vehicle positions feed
 CORS_GTFS_VEHICLE_POS = "https://corsproxy.io/?https://romamobilita.it/sites/default/files/rome_rtgtfs_vehicle_positions_feed.pb"
 
 # Roma mobilità - GTFS-RT trip_updates
 CORS_GTFS_TRIP_UPDATES = "https://corsproxy.io/?https://romamobilita.it/sites/default/files/rome_rtgtfs_trip_updates_feed.pb"
 
+# Roma mobilità - static GTFS (routes, trips, stops, shapes...)
+STATIC_GTFS = "https://romamobilita.it/sites/default/files/rome_static_gtfs.zip"
+
+# Data shipped with the repo and local caches (independent of the working directory)
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# On-disk columnar cache of the static GTFS
+STATIC_GTFS_CACHE = os.path.join(DATA_DIR, "static_gtfs")
+
 # Administrative boundaries of Rome - ISTAT (2022)
-ADMIN_BOUNDS = "https://raw.githubusercontent.com/ivandorte/Rome-in-transit/main/data/RomeAdmin.geojson"
+ADMIN_BOUNDS = os.path.join(DATA_DIR, "RomeAdmin.geojson")
+
+# Simplified administrative boundaries (cache)
+ADMIN_BOUNDS_CACHE = os.path.join(DATA_DIR, "RomeAdmin.npz")
 
 # Dashboard description
 DASH_DESC = f"""
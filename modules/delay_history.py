@@ -0,0 +1,211 @@
+"""
+Historical store of the vehicle delays.
+
+Each snapshot is appended (by a background writer, in batches) to a SQLite
+database partitioned by day: the raw observations go to a daily table
+(observations_YYYYMMDD) and their delays are also counted in a per
+day/hour/route histogram (1 minute bins), which answers percentile queries
+over months of data without scanning the observations.
+
+Routes are the route names of the static GTFS (routeName column): the
+history is only enabled once its cache has been built. Vehicles whose trip
+is not in the static GTFS are kept in the observations (empty route) but
+not counted in the histogram.
+"""
+
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from modules.time_utils import EU_ROME_TZ
+
+# Delay histogram bins (minutes), delays out of range are clipped
+MIN_DELAY_BIN = -60
+MAX_DELAY_BIN = 180
+
+HISTOGRAM_SCHEMA = """
+CREATE TABLE IF NOT EXISTS delay_histogram (
+    day TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    route TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, hour, route, bin)
+) WITHOUT ROWID
+"""
+
+# Statements creating a daily partition (run one by one: executescript would
+# commit the pending transaction)
+OBSERVATIONS_SCHEMA = (
+    """
+CREATE TABLE IF NOT EXISTS {table} (
+    observed_at INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    route TEXT NOT NULL,
+    trip_id TEXT NOT NULL,
+    vehicle_id TEXT NOT NULL,
+    delay REAL NOT NULL
+)
+""",
+    "CREATE INDEX IF NOT EXISTS {table}_route_hour ON {table} (route, hour)",
+)
+
+
+class DelayHistory:
+    """
+    Append-only delay history. `append` only queues the snapshot, the
+    writer thread flushes the queue every `flush_interval` seconds
+    in a single transaction, so ingestion never blocks the dashboard.
+    The queue is flushed a last time on `close` (called at exit).
+    """
+
+    def __init__(self, path, flush_interval=30):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.stats = {"snapshots": 0, "rows": 0, "flushes": 0}
+        self._queue = queue.Queue()
+        self._partitions = set()
+        self._closed = threading.Event()
+
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(HISTOGRAM_SCHEMA)
+
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def append(self, data, observed_at=None):
+        """
+        Queues the delays of a snapshot (enriched with the static GTFS).
+        """
+
+        if "routeName" not in data:
+            raise ValueError("The delay history needs the route names of the static GTFS")
+
+        observed_at = int(time.time() if observed_at is None else observed_at)
+        known = data["delay"].notna().to_numpy()
+        routes = data["routeName"]
+
+        self._queue.put(
+            (
+                observed_at,
+                routes.to_numpy(dtype=str)[known],
+                data["tripID"].to_numpy(dtype=str)[known],
+                data["vehicleID"].to_numpy(dtype=str)[known],
+                data["delay"].to_numpy(dtype=float)[known],
+            )
+        )
+
+    def flush(self, connection):
+        """
+        Writes all the queued snapshots.
+        """
+
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if not batch:
+            return
+
+        # A single transaction, partitions included
+        partitions = set()
+        with connection:
+            connection.execute("BEGIN")
+            for observed_at, routes, trip_ids, vehicle_ids, delays in batch:
+                local_time = dt.fromtimestamp(observed_at, tz=EU_ROME_TZ)
+                day = local_time.strftime("%Y%m%d")
+                hour = local_time.hour
+
+                table = f"observations_{day}"
+                if table not in self._partitions | partitions:
+                    for statement in OBSERVATIONS_SCHEMA:
+                        connection.execute(statement.format(table=table))
+                    partitions.add(table)
+
+                connection.executemany(
+                    f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?)",
+                    zip(
+                        [observed_at] * len(delays),
+                        [hour] * len(delays),
+                        routes.tolist(),
+                        trip_ids.tolist(),
+                        vehicle_ids.tolist(),
+                        delays.tolist(),
+                    ),
+                )
+
+                # Count the delays of each known route in the histogram
+                bins = np.clip(np.rint(delays), MIN_DELAY_BIN, MAX_DELAY_BIN).astype(int)
+                known_routes = routes != ""
+                counts = pd.DataFrame(
+                    {"route": routes[known_routes], "bin": bins[known_routes]}
+                ).value_counts()
+                connection.executemany(
+                    "INSERT INTO delay_histogram VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (day, hour, route, bin) "
+                    "DO UPDATE SET count = count + excluded.count",
+                    (
+                        (day, hour, route, int(delay_bin), int(count))
+                        for (route, delay_bin), count in counts.items()
+                    ),
+                )
+                self.stats["rows"] += len(delays)
+                self.stats["snapshots"] += 1
+        self._partitions |= partitions
+        self.stats["flushes"] += 1
+
+    def close(self):
+        """
+        Flushes the queued snapshots and stops the writer.
+        """
+
+        self._closed.set()
+        self._writer.join()
+
+    def _write(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            while not self._closed.wait(self.flush_interval):
+                self.flush(connection)
+            self.flush(connection)
+        finally:
+            connection.close()
+
+
+def get_delay_percentiles(path, start_day, end_day, percentiles=(50, 90, 95), routes=None):
+    """
+    Returns the delay percentiles (minutes, 1 minute resolution) of each
+    route and hour of the day between start_day and end_day (YYYYMMDD,
+    inclusive), as a DataFrame (route, hour, count, p50, p90...).
+    """
+
+    query = (
+        "SELECT route, hour, bin, SUM(count) AS count FROM delay_histogram "
+        "WHERE day BETWEEN ? AND ?"
+    )
+    parameters = [start_day, end_day]
+    if routes is not None:
+        query += f" AND route IN ({', '.join('?' * len(routes))})"
+        parameters.extend(routes)
+    query += " GROUP BY route, hour, bin ORDER BY route, hour, bin"
+
+    with sqlite3.connect(path) as connection:
+        histogram = pd.read_sql_query(query, connection, params=parameters)
+
+    rows = []
+    for (route, hour), group in histogram.groupby(["route", "hour"], sort=False):
+        counts = group["count"].to_numpy()
+        cumulative = np.cumsum(counts)
+        row = {"route": route, "hour": hour, "count": int(cumulative[-1])}
+        for percentile in percentiles:
+            position = np.searchsorted(cumulative, cumulative[-1] * percentile / 100)
+            row[f"p{percentile}"] = int(group["bin"].iloc[position])
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["route", "hour", "count"] + [f"p{p}" for p in percentiles])
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+
+# Share of hidden rows (vehicles that left) above which a full update
+# compacts the rows of the layers
+MAX_HIDDEN = 0.25
+
+# Share of changed rows above which a column is replaced whole instead of
+# patched (a patch costs more per value than a binary column)
+MAX_PATCHED = 0.5
+
+
+def align_snapshot(previous, current, key="vehicleID", hide=("x", "y"), max_hidden=MAX_HIDDEN):
+    """
+    Reorders the current snapshot so that the vehicles already drawn keep
+    their row, followed by the vehicles that just appeared. The vehicles
+    that left keep their row too, hidden (NaN `hide` columns).
+    Returns None if a full update is needed: duplicated keys, or hidden
+    rows above `max_hidden` of the rows.
+    """
+
+    if not len(current) or not (previous[key].is_unique and current[key].is_unique):
+        return None
+
+    positions = pd.Index(current[key]).get_indexer(previous[key])
+    removed = positions < 0
+    added = np.setdiff1d(np.arange(len(current)), positions[~removed], assume_unique=True)
+    if removed.sum() > max_hidden * (len(previous) + len(added)):
+        return None
+
+    aligned = current.iloc[np.concatenate([np.where(removed, 0, positions), added])]
+    aligned = aligned.reset_index(drop=True)
+    if removed.any():
+        rows = np.flatnonzero(removed)
+        hidden = previous.iloc[rows].reset_index(drop=True)
+        for column in aligned.columns:
+            values = aligned[column].to_numpy(copy=True)
+            values[rows] = np.nan if column in hide else hidden[column].to_numpy()
+            aligned[column] = values
+    return aligned
+
+
+def get_changed_rows(previous, aligned, column):
+    """
+    Returns the positions of the rows whose value changed.
+    """
+
+    old = previous[column].reset_index(drop=True)
+    new = aligned[column].iloc[: len(previous)]
+    changed = old.ne(new) & ~(old.isna() & new.isna())
+    return np.flatnonzero(changed.to_numpy())
+
+
+class DeltaUpdater:
+    """
+    Pushes the snapshots of a session into the stream layers.
+
+    Vehicles are keyed by `vehicleID`: the new vehicles are streamed into
+    the ColumnDataSources of the layers, then each column is updated on its
+    own: replaced whole if most of its rows changed (e.g. lastUpdate, x/y),
+    patched if only a few did, left alone if none did (e.g. vehicleID).
+    The vehicles that left are hidden (NaN x/y) in place; once they are too
+    many (see align_snapshot), the whole snapshot is sent through the pipe,
+    which compacts the rows.
+    """
+
+    def __init__(self, pipe, key="vehicleID"):
+        self.pipe = pipe
+        self.key = key
+        # The snapshot the pipe was created with is drawn on the first render
+        self.previous = pipe.data if len(pipe.data) else None
+        self.sources = {}
+        self.stats = {
+            "full": 0,
+            "delta": 0,
+            "patched_values": 0,
+            "replaced_columns": 0,
+            "streamed_rows": 0,
+        }
+
+    def hook(self, **aliases):
+        """
+        Returns a HoloViews plot hook that registers the ColumnDataSource
+        of a layer. `aliases` maps the CDS columns added by HoloViews
+        (e.g. color) to the snapshot columns they mirror.
+        """
+
+        # A layer rendered again (e.g. in a dynamic tab) replaces its source
+        layer = object()
+
+        def register_source(plot, element):
+            self.sources[layer] = (plot.handles["source"], aliases)
+
+        return register_source
+
+    def send(self, data):
+        """
+        Pushes a new snapshot into the stream layers.
+        """
+
+        aligned = None
+        if self.previous is not None and self.sources:
+            aligned = align_snapshot(self.previous, data, self.key)
+
+        if aligned is None or not self._patch_sources(aligned):
+            self.pipe.send(data)
+            self.previous = data
+            self.stats["full"] += 1
+            return
+
+        # Keep the pipe in sync without re-rendering the layers
+        self.pipe.update(data=aligned)
+        self.previous = aligned
+        self.stats["delta"] += 1
+
+    def _patch_sources(self, aligned):
+        n_previous = len(self.previous)
+        changed = {}
+
+        updates = []
+        for source, aliases in self.sources.values():
+            columns = {name: aliases.get(name, name) for name in source.data}
+            if any(column not in aligned for column in columns.values()):
+                return False
+            updates.append((source, columns))
+
+        for source, columns in updates:
+            # Stream first, so that the replaced columns keep the length of the others
+            if len(aligned) > n_previous:
+                added = aligned.iloc[n_previous:]
+                source.stream({name: added[column].to_numpy() for name, column in columns.items()})
+                self.stats["streamed_rows"] += len(added)
+
+            replaced = {}
+            patches = {}
+            for name, column in columns.items():
+                if column not in changed:
+                    changed[column] = get_changed_rows(self.previous, aligned, column)
+                rows = changed[column]
+                if len(rows) > MAX_PATCHED * n_previous:
+                    replaced[name] = aligned[column].to_numpy()
+                    self.stats["replaced_columns"] += 1
+                elif len(rows):
+                    values = aligned[column].to_numpy()[rows]
+                    patches[name] = list(zip(rows.tolist(), values.tolist()))
+                    self.stats["patched_values"] += len(rows)
+            if replaced:
+                source.data.update(replaced)
+            if patches:
+                source.patch(patches)
+        return True
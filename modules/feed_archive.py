@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Codes of the archived feeds
+FEED_CODES = {"vehicle": 0, "trip": 1}
+
+# A record of the index: fetch time (POSIX), feed code, offset and
+# length of the compressed payload in the payloads file
+INDEX_DTYPE = np.dtype(
+    [
+        ("fetched_at", "<f8"),
+        ("feed", "u1"),
+        ("offset", "<u8"),
+        ("length", "<u4"),
+    ]
+)
+
+INDEX_FILE = "index.bin"
+PAYLOADS_FILE = "payloads.bin"
+
+
+class FeedRecorder:
+    """
+    Archives the raw GTFS-RT payloads into `path`: the zlib compressed
+    payloads are appended to payloads.bin and a fixed-size record is
+    appended to index.bin (see INDEX_DTYPE), which can be memory-mapped.
+    """
+
+    def __init__(self, path, level=6):
+        os.makedirs(path, exist_ok=True)
+        self.level = level
+        self._payloads = open(os.path.join(path, PAYLOADS_FILE), "ab")
+        self._index = open(os.path.join(path, INDEX_FILE), "ab")
+        self._lock = threading.Lock()
+
+    def record(self, feed, payload, fetched_at=None):
+        """
+        Appends a raw payload of the feed ("vehicle" or "trip").
+        """
+
+        compressed = zlib.compress(payload, self.level)
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record["fetched_at"] = time.time() if fetched_at is None else fetched_at
+        record["feed"] = FEED_CODES[feed]
+        record["length"] = len(compressed)
+
+        with self._lock:
+            record["offset"] = self._payloads.seek(0, os.SEEK_END)
+            self._payloads.write(compressed)
+            self._payloads.flush()
+            self._index.write(record.tobytes())
+            self._index.flush()
+
+    def close(self):
+        self._payloads.close()
+        self._index.close()
+
+
+def load_index(path):
+    """
+    Returns the (memory-mapped) index of an archive.
+    """
+
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.getsize(index_path):
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    return np.memmap(index_path, dtype=INDEX_DTYPE, mode="r")
+
+
+class ReplaySource:
+    """
+    A feed source (see rome_gtfs_rt.get_data) that replays an archive
+    recorded by FeedRecorder, at real-time (speed=1) or accelerated speed.
+    Each read returns the latest payload fetched before the replay clock,
+    or None if it was already returned.
+    """
+
+    def __init__(self, path, speed=1.0, loop=True):
+        self.speed = speed
+        self.loop = loop
+        self.index = load_index(path)
+        self._payloads = open(os.path.join(path, PAYLOADS_FILE), "rb")
+        self._lock = threading.Lock()
+
+        # Positions of the records of each feed, sorted by fetch time
+        self.records = {}
+        for feed, code in FEED_CODES.items():
+            rows = np.flatnonzero(self.index["feed"] == code)
+            rows = rows[np.argsort(self.index["fetched_at"][rows], kind="stable")]
+            self.records[feed] = (rows, np.asarray(self.index["fetched_at"][rows]))
+
+        self.start_time = float(self.index["fetched_at"].min()) if len(self.index) else 0.0
+        self.end_time = float(self.index["fetched_at"].max()) if len(self.index) else 0.0
+        self.rewind()
+
+    def rewind(self):
+        """
+        Restarts the replay from the first record.
+        """
+
+        self._started_at = time.monotonic()
+        self._last_rows = {feed: None for feed in FEED_CODES}
+
+    def clock(self):
+        """
+        Returns the current replay time (POSIX).
+        """
+
+        elapsed = (time.monotonic() - self._started_at) * self.speed
+        if self.loop and self.start_time + elapsed > self.end_time:
+            self.rewind()
+            elapsed = 0.0
+        return self.start_time + elapsed
+
+    def read(self, feed):
+        """
+        Returns the raw content of the feed, None if it is unchanged.
+        """
+
+        rows, fetched_at = self.records[feed]
+        position = np.searchsorted(fetched_at, self.clock(), side="right") - 1
+        if position < 0 or rows[position] == self._last_rows[feed]:
+            return None
+        self._last_rows[feed] = rows[position]
+        return self.read_payload(rows[position])
+
+    def read_payload(self, row):
+        """
+        Returns the decompressed payload of an index record.
+        """
+
+        record = self.index[row]
+        with self._lock:
+            self._payloads.seek(int(record["offset"]))
+            compressed = self._payloads.read(int(record["length"]))
+        return zlib.decompress(compressed)
+
+    def invalidate(self, feed):
+        self._last_rows[feed] = None
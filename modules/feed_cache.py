@@ -0,0 +1,236 @@
+import logging
+import os
+import threading
+import time
+from functools import partial
+
+from modules.fetch import FETCH_STATS, FeedUnavailableError
+from modules.metrics import PROFILER, register_counters, register_gauge, timed
+from modules.rome_gtfs_rt import FULL_DF_SCHEMA, HTTP_SOURCE, HttpFeedSource, get_data
+from modules.static_gtfs import load_static_gtfs
+from modules.trails import VehicleTrails
+
+logger = logging.getLogger(__name__)
+
+# Static GTFS (routes, stops...), None if its cache has not been built
+STATIC_GTFS = load_static_gtfs()
+
+
+def get_loader():
+    """
+    Returns the snapshot loader configured by the environment:
+
+    - GTFS_RT_REPLAY: replay the archive at this path instead of the live feed;
+    - GTFS_RT_REPLAY_SPEED: replay speed (default 1, real-time);
+    - GTFS_RT_RECORD: archive the raw payloads into this path;
+    - GTFS_RT_VEHICLE_URL, GTFS_RT_TRIP_URL: read the feeds from these urls
+      (e.g. the stub server of benchmarks/bench_load.py).
+
+    Vehicles are enriched with the static GTFS, if its cache has been built.
+    """
+
+    source = HTTP_SOURCE
+    if os.environ.get("GTFS_RT_VEHICLE_URL") and os.environ.get("GTFS_RT_TRIP_URL"):
+        source = HttpFeedSource(
+            (os.environ["GTFS_RT_VEHICLE_URL"], os.environ["GTFS_RT_TRIP_URL"])
+        )
+    if os.environ.get("GTFS_RT_REPLAY"):
+        from modules.feed_archive import ReplaySource
+
+        speed = float(os.environ.get("GTFS_RT_REPLAY_SPEED", 1))
+        source = ReplaySource(os.environ["GTFS_RT_REPLAY"], speed=speed)
+
+    recorder = None
+    if os.environ.get("GTFS_RT_RECORD"):
+        from modules.feed_archive import FeedRecorder
+
+        recorder = FeedRecorder(os.environ["GTFS_RT_RECORD"])
+
+    return partial(get_data, source=source, recorder=recorder, static=STATIC_GTFS)
+
+
+class FeedCache:
+    """
+    Process-wide cache of the latest GTFS-RT snapshot.
+
+    A single background poller refreshes the snapshot every `ttl` seconds
+    and every dashboard session reads the same, already built DataFrame.
+    A snapshot older than `ttl` but younger than `max_stale` is still
+    served while a refresh runs in the background (stale-while-revalidate).
+
+    Refreshes are single-flight, even when they fail: the callers that
+    waited for a refresh get its result instead of loading again, and
+    while the poller runs the sessions never refresh by themselves.
+
+    The loader returns None when the feed did not change: the current
+    snapshot (and its version) is kept and the tick is counted as skipped.
+    Listeners are called (in the poller thread) with every new snapshot.
+    """
+
+    def __init__(self, loader, ttl=10, max_stale=60):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+
+        self.data = FULL_DF_SCHEMA
+        self.version = 0
+        self.fetched_at = None
+        # Refreshes attempted (successful or not)
+        self.attempts = 0
+
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "skipped": 0,
+            "errors": 0,
+            "fan_outs": 0,
+            "fan_out_time": 0.0,
+            "dropped_ticks": 0,
+        }
+
+        self.listeners = []
+
+        self._refresh_lock = threading.Lock()
+        self._poller = None
+
+    def age(self):
+        """
+        Seconds elapsed since the latest successful refresh.
+        """
+
+        if self.fetched_at is None:
+            return float("inf")
+        return time.monotonic() - self.fetched_at
+
+    def refresh(self):
+        """
+        Loads a new snapshot, unless another thread refreshed it (or tried
+        to) meanwhile.
+        """
+
+        attempts = self.attempts
+        with self._refresh_lock:
+            if self.attempts != attempts or self.age() < self.ttl:
+                return
+            try:
+                with PROFILER.tick(), timed("refresh"):
+                    data = self.loader()
+            except FeedUnavailableError as error:
+                # Keep serving the last good snapshot
+                self.stats["errors"] += 1
+                logger.warning("GTFS-RT feed unavailable: %s", error)
+                return
+            except Exception:
+                self.stats["errors"] += 1
+                logger.exception("Unable to refresh the GTFS-RT snapshot")
+                return
+            finally:
+                self.attempts += 1
+            self.fetched_at = time.monotonic()
+            self.stats["refreshes"] += 1
+            if data is None:
+                self.stats["skipped"] += 1
+                return
+            self.data = data
+            self.version += 1
+
+            for listener in self.listeners:
+                try:
+                    listener(data)
+                except Exception:
+                    logger.exception("Snapshot listener %r failed", listener)
+
+    def refresh_in_background(self):
+        """
+        Starts a refresh without waiting for it.
+        """
+
+        if not self._refresh_lock.locked():
+            threading.Thread(target=self.refresh, daemon=True).start()
+
+    def latest(self):
+        """
+        Returns the latest snapshot and its version, without refreshing it.
+        """
+
+        return self.data, self.version
+
+    def get(self):
+        """
+        Returns the latest snapshot and its version. Refreshes it if it is
+        too old, unless the poller does.
+        """
+
+        age = self.age()
+        polling = self._poller is not None
+        if age < self.ttl:
+            self.stats["hits"] += 1
+        elif age < self.max_stale:
+            self.stats["stale_hits"] += 1
+            if not polling:
+                self.refresh_in_background()
+        else:
+            self.stats["misses"] += 1
+            if not polling:
+                self.refresh()
+        return self.data, self.version
+
+    def record_fan_out(self, elapsed):
+        """
+        Records the time spent by a session to push a snapshot.
+        """
+
+        self.stats["fan_outs"] += 1
+        self.stats["fan_out_time"] += elapsed
+
+    def hit_ratio(self):
+        """
+        Share of the reads served from the cache (fresh or stale).
+        """
+
+        hits = self.stats["hits"] + self.stats["stale_hits"]
+        reads = hits + self.stats["misses"]
+        return hits / reads if reads else 0.0
+
+    def start(self):
+        """
+        Starts the background poller (only once per process).
+        """
+
+        if self._poller is None:
+            self._poller = threading.Thread(target=self._poll, daemon=True)
+            self._poller.start()
+
+    def _poll(self):
+        while True:
+            self.refresh()
+            time.sleep(self.ttl)
+
+
+# The feed cache shared by all the dashboard sessions
+FEED_CACHE = FeedCache(get_loader())
+
+register_counters("feed_cache", FEED_CACHE.stats)
+register_gauge("feed_cache_hit_ratio", FEED_CACHE.hit_ratio)
+register_counters("fetch", FETCH_STATS)
+
+# Trails of the latest positions of the vehicles
+VEHICLE_TRAILS = VehicleTrails()
+FEED_CACHE.listeners.append(VEHICLE_TRAILS.append)
+register_counters("trails", VEHICLE_TRAILS.stats)
+
+# Record the delays of every snapshot (DELAY_HISTORY: path of the SQLite database),
+# by route: the static GTFS cache is needed
+if os.environ.get("DELAY_HISTORY") and STATIC_GTFS is None:
+    logger.warning(
+        "DELAY_HISTORY is ignored: the delay history needs the static GTFS cache "
+        "(python -m modules.static_gtfs)"
+    )
+elif os.environ.get("DELAY_HISTORY"):
+    from modules.delay_history import DelayHistory
+
+    DELAY_HISTORY = DelayHistory(os.environ["DELAY_HISTORY"])
+    FEED_CACHE.listeners.append(DELAY_HISTORY.append)
+    register_counters("delay_history", DELAY_HISTORY.stats)
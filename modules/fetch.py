@@ -0,0 +1,202 @@
+import hashlib
+import random
+import time
+
+import requests
+from modules.metrics import STAGE_SECONDS
+
+# Keep-alive connection pool shared by all the feed requests
+SESSION = requests.Session()
+SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4))
+
+# Connect and read timeouts (seconds)
+TIMEOUT = (3.05, 5)
+
+# Attempts per request and exponential backoff between them (seconds)
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 4
+
+# Overall time budget (seconds) of the attempts of a request, below the
+# refresh period of the feed cache (10 s) so that a request never outlives a tick
+DEADLINE = 8
+
+# Consecutive failed requests before the circuit opens, and seconds before it is retried
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 60
+
+# Validators (ETag, Last-Modified, content digest) of the latest response of each feed
+VALIDATORS = {}
+
+# Outcomes of the attempts that are retried (4xx and other errors are not)
+RETRIED_OUTCOMES = {"server_error", "empty", "connection_error", "timeout"}
+
+# Fetch counters: responses skipped because the feed was not regenerated, attempts,
+# failed attempts and requests rejected by an open circuit
+FETCH_STATS = {"not_modified": 0, "unchanged": 0, "attempts": 0, "failures": 0, "rejected": 0}
+
+
+class FeedUnavailableError(Exception):
+    """
+    Raised when a feed cannot be downloaded.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops requesting a feed after `failure_threshold` consecutive failed
+    requests, then lets a single trial request through every `reset_timeout`
+    seconds until one succeeds.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        """
+        Returns True if a request can be sent.
+        """
+
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Half-open: let a trial request through
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+# A circuit breaker for each feed url
+BREAKERS = {}
+
+
+def get_backoff(attempt):
+    """
+    Returns the delay before the next attempt (exponential backoff with full jitter).
+    """
+
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+def get_outcome(response):
+    """
+    Returns the outcome of an attempt from its response.
+    """
+
+    if response.status_code == 304:
+        return "not_modified"
+    if response.status_code >= 500:
+        return "server_error"
+    if response.status_code >= 400:
+        return "client_error"
+    if not response.content:
+        return "empty"
+    return "ok"
+
+
+def request_feed(url, headers):
+    """
+    Sends the request, retrying on server errors (5xx), empty responses,
+    connection errors and timeouts, within DEADLINE seconds overall (the
+    timeouts of the last attempt are shortened to fit). The latency of
+    each attempt is recorded in the fetch_attempt_<outcome> stage.
+    """
+
+    deadline = time.monotonic() + DEADLINE
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            backoff = get_backoff(attempt - 1)
+            if time.monotonic() + backoff >= deadline:
+                break
+            time.sleep(backoff)
+
+        remaining = deadline - time.monotonic()
+        timeout = tuple(min(value, remaining) for value in TIMEOUT)
+        FETCH_STATS["attempts"] += 1
+        start = time.perf_counter()
+        try:
+            response = SESSION.get(url, headers=headers, timeout=timeout)
+            outcome, last_error = get_outcome(response), None
+        except requests.Timeout as error:
+            outcome, last_error = "timeout", error
+        except requests.ConnectionError as error:
+            outcome, last_error = "connection_error", error
+        except requests.RequestException as error:
+            outcome, last_error = "error", error
+        STAGE_SECONDS.observe(f"fetch_attempt_{outcome}", time.perf_counter() - start)
+
+        if outcome in ("ok", "not_modified"):
+            return response
+        FETCH_STATS["failures"] += 1
+        if outcome not in RETRIED_OUTCOMES:
+            break
+
+    raise FeedUnavailableError(f"Unable to download {url} ({outcome})") from last_error
+
+
+def fetch_feed(url):
+    """
+    Downloads a GTFS-RT feed and returns its raw (protobuf) content,
+    or None if the feed did not change since the previous request.
+
+    Conditional requests are used when the server provides an ETag or a
+    Last-Modified header, otherwise the content digest is compared.
+    Raises FeedUnavailableError when every attempt failed, or while the
+    circuit breaker of the feed is open.
+    """
+
+    breaker = BREAKERS.setdefault(url, CircuitBreaker())
+    if not breaker.allow():
+        FETCH_STATS["rejected"] += 1
+        raise FeedUnavailableError(f"Circuit open for {url}")
+
+    etag, last_modified, digest = VALIDATORS.get(url, (None, None, None))
+
+    headers = {"Cache-Control": "no-cache"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    try:
+        response = request_feed(url, headers)
+    except FeedUnavailableError:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+
+    if response.status_code == 304:
+        FETCH_STATS["not_modified"] += 1
+        return None
+
+    content = response.content
+    new_digest = hashlib.blake2b(content, digest_size=16).digest()
+    VALIDATORS[url] = (
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified"),
+        new_digest,
+    )
+    if new_digest == digest:
+        FETCH_STATS["unchanged"] += 1
+        return None
+    return content
+
+
+def invalidate(url):
+    """
+    Forgets the validators of a feed, so the next request downloads it again.
+    """
+
+    VALIDATORS.pop(url, None)
@@ -0,0 +1,395 @@
+"""
+Transport-agnostic core of the GTFS-RT ingestion, shared by the server app
+(modules.rome_gtfs_rt, blocking HTTP) and the browser build
+(modules_pyodide/rome_gtfs_rt.py, fetch API): raw feed payloads in,
+columnar snapshot (pandas DataFrame) out.
+
+In the browser build the modules are loaded flat (not as a package).
+"""
+
+import numpy as np
+import pandas as pd
+from google.transit import gtfs_realtime_pb2
+
+try:
+    from modules.colors import IN_TRANSIT_CL, LATE_CL, ON_TIME_CL, STOPPED_CL, UNKNOWN_CL
+    from modules.projection import to_web_mercator
+    from modules.time_utils import timestamps_to_hms
+except ImportError:
+    from colors import IN_TRANSIT_CL, LATE_CL, ON_TIME_CL, STOPPED_CL, UNKNOWN_CL
+    from projection import to_web_mercator
+    from time_utils import timestamps_to_hms
+
+# Vehicle Dataframe columns
+VEHICLE_DF_COLUMNS = [
+    "x",
+    "y",
+    "vehicleID",
+    "tripID",
+    "startTime",
+    "lastUpdate",
+    "currentStatus",
+    "statusCode",
+]
+
+# Delay Dataframe columns
+DELAY_DF_COLUMNS = [
+    "tripID",
+    "delay",
+    "delayCode",
+    "nextStopDelay",
+    "maxDelay",
+    "delayTrend",
+]
+
+# Vehicle status codes (statusCode column) and their labels
+STATUS_CLASSES = {0: "In Transit", 1: "Stopped"}
+STATUS_COLORS = {0: IN_TRANSIT_CL, 1: STOPPED_CL}
+
+# Delay class codes (delayCode column) and their labels.
+# Unknown: vehicles whose trip has no trip update
+DELAY_CLASSES = {-1: "Unknown", 0: "On time", 1: "Late"}
+DELAY_COLORS = {-1: UNKNOWN_CL, 0: ON_TIME_CL, 1: LATE_CL}
+
+VEHICLE_DF_SCHEMA = pd.DataFrame([], columns=VEHICLE_DF_COLUMNS)
+
+DELAY_DF_SCHEMA = pd.DataFrame([], columns=DELAY_DF_COLUMNS)
+
+FULL_DF_SCHEMA = VEHICLE_DF_SCHEMA.merge(DELAY_DF_SCHEMA, on="tripID")
+
+# Stop time updates decoded for each trip (current stop + downstream stops),
+# bounds the decoding cost of the trip updates feed
+MAX_STOP_UPDATES = 20
+
+# How vehicles are joined with the trip updates: "left" keeps the vehicles
+# without a trip update (delayCode -1), "inner" drops them
+JOIN_HOW = "left"
+
+
+def parse_feed(payload):
+    """
+    Parses a raw feed payload into a FeedMessage.
+    """
+
+    feed_message = gtfs_realtime_pb2.FeedMessage()
+    feed_message.ParseFromString(payload)
+    return feed_message
+
+
+def get_vehicle_positions(longitudes, latitudes):
+    """
+    Returns the xy positions (EPSG:3857) of the processed entities.
+    """
+
+    return to_web_mercator(longitudes, latitudes)
+
+
+def get_current_status_code(current_status):
+    """
+    Returns the code of the Vehicles current status
+    (see STATUS_CLASSES: In transit/Stopped).
+    """
+
+    return (current_status == 1).astype(np.int8)
+
+
+def get_delay_code(delay):
+    """
+    Returns the code of the delay class (see DELAY_CLASSES: On time/Late,
+    Unknown if the delay is missing).
+    """
+
+    return np.where(np.isnan(delay), -1, delay > 0).astype(np.int8)
+
+
+def decode_vehicle_feed(vehicle_feed):
+    """
+    Decodes a vehicle position FeedMessage into a pandas DataFrame.
+    """
+
+    # Vehicle attributes, one column at a time
+    vehicles = [entity.vehicle for entity in vehicle_feed.entity]
+    longitudes = np.fromiter(
+        (vehicle.position.longitude for vehicle in vehicles), float, len(vehicles)
+    )
+    latitudes = np.fromiter(
+        (vehicle.position.latitude for vehicle in vehicles), float, len(vehicles)
+    )
+    timestamps = np.fromiter(
+        (vehicle.timestamp for vehicle in vehicles), np.int64, len(vehicles)
+    )
+    current_status = np.fromiter(
+        (vehicle.current_status for vehicle in vehicles), np.int8, len(vehicles)
+    )
+
+    x, y = get_vehicle_positions(longitudes, latitudes)
+
+    data = pd.DataFrame(
+        {
+            "x": x,
+            "y": y,
+            "vehicleID": [vehicle.vehicle.id for vehicle in vehicles],
+            "tripID": [vehicle.trip.trip_id.strip() for vehicle in vehicles],
+            "startTime": [vehicle.trip.start_time for vehicle in vehicles],
+            "lastUpdate": timestamps_to_hms(timestamps),
+            "currentStatus": current_status,
+            "statusCode": get_current_status_code(current_status),
+        },
+        columns=VEHICLE_DF_COLUMNS,
+    )
+    return data
+
+
+def decode_stop_time_updates(trip_update_feed):
+    """
+    Decodes all the stop time updates of a trip updates FeedMessage into
+    flat arrays. The updates of the i-th trip are in the
+    [offsets[i], offsets[i + 1]) slice of the stop_* arrays.
+    Delays are in seconds, NaN if missing.
+    Only the first MAX_STOP_UPDATES updates of each trip are decoded.
+    """
+
+    trip_updates = [entity.trip_update for entity in trip_update_feed.entity]
+    counts = np.fromiter(
+        (len(trip.stop_time_update) for trip in trip_updates), np.int64, len(trip_updates)
+    )
+    np.minimum(counts, MAX_STOP_UPDATES, out=counts)
+    offsets = np.zeros(len(trip_updates) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    stop_time_updates = [
+        stop_time_update
+        for trip in trip_updates
+        for stop_time_update in trip.stop_time_update[:MAX_STOP_UPDATES]
+    ]
+    arrival_delays = np.fromiter(
+        (
+            update.arrival.delay if update.HasField("arrival") else np.nan
+            for update in stop_time_updates
+        ),
+        float,
+        len(stop_time_updates),
+    )
+    departure_delays = np.fromiter(
+        (
+            update.departure.delay if update.HasField("departure") else np.nan
+            for update in stop_time_updates
+        ),
+        float,
+        len(stop_time_updates),
+    )
+
+    return {
+        "tripID": [trip.trip.trip_id.strip() for trip in trip_updates],
+        "offsets": offsets,
+        "stop_sequence": np.fromiter(
+            (update.stop_sequence for update in stop_time_updates),
+            np.int32,
+            len(stop_time_updates),
+        ),
+        "stop_id": [update.stop_id for update in stop_time_updates],
+        "arrival_delay": arrival_delays,
+        "departure_delay": departure_delays,
+    }
+
+
+def get_trip_delays(stop_times):
+    """
+    Aggregates the stop time updates of each trip (see decode_stop_time_updates)
+    and returns the current stop delay, the next stop delay, the max downstream
+    delay and the delay trend (last decoded - current stop delay), in minutes.
+    """
+
+    offsets = stop_times["offsets"]
+    starts, ends = offsets[:-1], offsets[1:]
+    counts = ends - starts
+
+    # The arrival delay, or the departure delay if the arrival is missing
+    stop_delays = np.where(
+        np.isnan(stop_times["arrival_delay"]),
+        stop_times["departure_delay"],
+        stop_times["arrival_delay"],
+    )
+    stop_delays = np.append(stop_delays, np.nan) / 60
+
+    # Trips without stop time updates point to the trailing NaN
+    no_updates = len(stop_delays) - 1
+    current = stop_delays[np.where(counts > 0, starts, no_updates)]
+    following = stop_delays[np.where(counts > 1, starts + 1, no_updates)]
+    last = stop_delays[np.where(counts > 0, ends - 1, no_updates)]
+
+    max_delays = np.full(len(counts), np.nan)
+    has_updates = counts > 0
+    if has_updates.any():
+        with np.errstate(invalid="ignore"):
+            max_delays[has_updates] = np.fmax.reduceat(
+                stop_delays[:-1], starts[has_updates]
+            )
+
+    return current, following, max_delays, last - current
+
+
+def decode_delay_feed(trip_update_feed):
+    """
+    Decodes a trip updates FeedMessage into a pandas DataFrame.
+    """
+
+    stop_times = decode_stop_time_updates(trip_update_feed)
+    delays, next_stop_delays, max_delays, delay_trends = get_trip_delays(stop_times)
+
+    data = pd.DataFrame(
+        {
+            "tripID": stop_times["tripID"],
+            "delay": delays,
+            "delayCode": get_delay_code(delays),
+            "nextStopDelay": next_stop_delays,
+            "maxDelay": max_delays,
+            "delayTrend": delay_trends,
+        },
+        columns=DELAY_DF_COLUMNS,
+    )
+    return data
+
+
+class DelayIndex:
+    """
+    tripID-keyed index of the latest trip updates, maintained across ticks.
+    Each trip keeps its row (slot) in the column arrays: an update only adds
+    the slots of the new trips to the dict and overwrites the values, and
+    vehicles are joined by positional lookup. Slots of the trips that left
+    the feed are reused once they outnumber the current trips (compaction).
+    The column arrays end with a sentinel row of missing values, the row of
+    the vehicles without a trip update (position -1).
+    """
+
+    def __init__(self):
+        self.slots = {}
+        self.present = np.zeros(0, dtype=bool)
+        self.columns = {
+            "delay": np.full(1, np.nan),
+            "delayCode": np.full(1, -1, dtype=np.int8),
+            "nextStopDelay": np.full(1, np.nan),
+            "maxDelay": np.full(1, np.nan),
+            "delayTrend": np.full(1, np.nan),
+        }
+        self.compactions = 0
+
+    def __len__(self):
+        return int(self.present.sum())
+
+    def reserve(self, size):
+        """
+        Grows the column arrays (amortized doubling) to hold `size` slots.
+        """
+
+        capacity = len(self.present)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+        self.present = np.concatenate(
+            [self.present, np.zeros(capacity - len(self.present), dtype=bool)]
+        )
+        for column, values in self.columns.items():
+            grown = np.full(capacity + 1, values[-1], dtype=values.dtype)
+            grown[: len(values) - 1] = values[:-1]
+            self.columns[column] = grown
+
+    def update(self, delay_data):
+        """
+        Replaces the indexed trip updates.
+        """
+
+        trip_ids = delay_data["tripID"].to_numpy(dtype=object)
+
+        if len(self.slots) > 2 * max(len(trip_ids), 512):
+            # Drop the slots of the trips that left the feed
+            self.slots = {}
+            self.present[:] = False
+            self.compactions += 1
+
+        # New trips get the next free slot
+        slots = self.slots
+        rows = np.fromiter(
+            (slots.setdefault(trip_id, len(slots)) for trip_id in trip_ids),
+            np.int64,
+            len(trip_ids),
+        )
+        self.reserve(len(slots))
+
+        self.present[:] = False
+        self.present[rows] = True
+        for column, values in self.columns.items():
+            # Written in reverse, so that the first update of a duplicated trip wins
+            values[rows[::-1]] = delay_data[column].to_numpy(dtype=values.dtype)[::-1]
+
+    def get_positions(self, trip_ids):
+        """
+        Returns the slots of the trips, -1 for the trips without an update.
+        """
+
+        slots = self.slots
+        positions = np.fromiter(
+            (slots.get(trip_id, -1) for trip_id in trip_ids), np.int64, len(trip_ids)
+        )
+        if len(positions):
+            indexed = positions >= 0
+            indexed[indexed] = self.present[positions[indexed]]
+            positions[~indexed] = -1
+        return positions
+
+    def join(self, vehicle_data, how=JOIN_HOW):
+        """
+        Joins the vehicles with their trip updates (how: "left" or "inner").
+        Vehicles without a trip update get NaN delays and delayCode -1.
+        """
+
+        positions = self.get_positions(vehicle_data["tripID"].to_numpy(dtype=object))
+        if how == "inner":
+            matched = positions >= 0
+            vehicle_data = vehicle_data[matched]
+            positions = positions[matched]
+
+        full_data = vehicle_data.reset_index(drop=True)
+        for column, values in self.columns.items():
+            # -1 selects the sentinel row
+            full_data[column] = values[positions]
+        return full_data
+
+
+class SnapshotJoiner:
+    """
+    Joins the latest frames of the two feeds into the snapshot. A feed
+    that did not change (None) keeps its latest frame.
+    """
+
+    def __init__(self):
+        self.frames = {"vehicle": VEHICLE_DF_SCHEMA, "trip": DELAY_DF_SCHEMA}
+        self.delay_index = DelayIndex()
+
+    def update(self, vehicle_data, delay_data, how=JOIN_HOW):
+        """
+        Returns the snapshot, None if neither feed changed.
+        """
+
+        if vehicle_data is None and delay_data is None:
+            return None
+        if vehicle_data is not None:
+            self.frames["vehicle"] = vehicle_data
+        if delay_data is not None:
+            self.frames["trip"] = delay_data
+            self.delay_index.update(delay_data)
+        return self.delay_index.join(self.frames["vehicle"], how)
+
+
+def decode_snapshot(joiner, vehicle_payload, trip_payload, how=JOIN_HOW):
+    """
+    Decodes the raw payloads of the two feeds (None if unchanged) and
+    returns the joined snapshot, None if neither feed changed.
+    """
+
+    vehicle_data = trip_data = None
+    if vehicle_payload is not None:
+        vehicle_data = decode_vehicle_feed(parse_feed(vehicle_payload))
+    if trip_payload is not None:
+        trip_data = decode_delay_feed(parse_feed(trip_payload))
+    return joiner.update(vehicle_data, trip_data, how)
@@ -0,0 +1,221 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from tornado.web import Application, RequestHandler
+
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram with a "stage" label.
+    """
+
+    def __init__(self, name, description, buckets=BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, value):
+        with self._lock:
+            counts, total = self.stages.get(stage, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.stages[stage] = (counts, total + value)
+
+    def render(self):
+        """
+        Returns the histogram in the Prometheus text format.
+        """
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for stage, (counts, total) in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{stage="{stage}"}} {total}')
+                lines.append(f'{self.name}_count{{stage="{stage}"}} {cumulative}')
+        return "\n".join(lines)
+
+
+class Profiler:
+    """
+    Profiles (cProfile) the next N ticks once armed. Functions wrapped by
+    `profiled` are profiled in whatever thread they run, and their stats
+    are merged into a single report.
+    """
+
+    def __init__(self):
+        self.remaining_ticks = 0
+        self.report = "No profile recorded yet.\n"
+        self._stats = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def arm(self, ticks):
+        with self._lock:
+            self.remaining_ticks = ticks
+            self._stats = None
+
+    @property
+    def active(self):
+        return self.remaining_ticks > 0
+
+    @contextmanager
+    def profiled(self):
+        # A single profiler can run in each thread
+        if not self.active or getattr(self._local, "running", False):
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows a single active profiler: this thread is not profiled
+            yield
+            return
+        self._local.running = True
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.running = False
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    @contextmanager
+    def tick(self):
+        """
+        Wraps a whole tick, and writes the report after the last profiled one
+        (failed ticks count).
+        """
+
+        if not self.active:
+            yield
+            return
+
+        try:
+            with self.profiled():
+                yield
+        finally:
+            # Failed ticks (e.g. feed unavailable) count too
+            with self._lock:
+                self.remaining_ticks -= 1
+                if self.remaining_ticks == 0 and self._stats is not None:
+                    report = io.StringIO()
+                    self._stats.stream = report
+                    self._stats.sort_stats("cumulative").print_stats(40)
+                    self.report = report.getvalue()
+
+
+# Time spent in each stage of a tick (fetch, parse, decode, merge, send...)
+STAGE_SECONDS = Histogram("rome_in_transit_stage_seconds", "Time spent in each stage of a tick.")
+
+# Counters exported with the metrics: {prefix: stats dict}
+COUNTERS = {}
+
+# Gauges computed when the metrics are scraped: {name: function}
+GAUGES = {}
+
+PROFILER = Profiler()
+
+
+@contextmanager
+def timed(stage):
+    """
+    Records the time spent in a stage (and profiles it if the profiler is armed).
+    """
+
+    start = time.perf_counter()
+    try:
+        with PROFILER.profiled():
+            yield
+    finally:
+        STAGE_SECONDS.observe(stage, time.perf_counter() - start)
+
+
+def register_counters(prefix, stats):
+    """
+    Exports the numeric values of a stats dictionary (e.g. FEED_CACHE.stats).
+    """
+
+    COUNTERS[prefix] = stats
+
+
+def register_gauge(name, function):
+    """
+    Exports the value returned by a function (e.g. FEED_CACHE.hit_ratio).
+    """
+
+    GAUGES[name] = function
+
+
+def render_metrics():
+    """
+    Returns all the metrics in the Prometheus text format.
+    """
+
+    lines = [STAGE_SECONDS.render()]
+    for prefix, stats in sorted(COUNTERS.items()):
+        for key, value in sorted(stats.items()):
+            if isinstance(value, (int, float)):
+                lines.append(f"rome_in_transit_{prefix}_{key} {value}")
+    for name, function in sorted(GAUGES.items()):
+        lines.append(f"rome_in_transit_{name} {function()}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(render_metrics())
+
+
+class ProfileHandler(RequestHandler):
+    """
+    GET /profile?ticks=N arms the profiler for the next N ticks,
+    GET /profile returns the latest report.
+    """
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain")
+        ticks = self.get_argument("ticks", None)
+        if ticks is not None:
+            PROFILER.arm(int(ticks))
+            self.write(f"Profiling the next {ticks} ticks.\n")
+        else:
+            self.write(PROFILER.report)
+
+
+# Routes of the metrics (also usable as a Panel server plugin: --plugins modules.metrics)
+ROUTES = [
+    (r"/metrics", MetricsHandler, {}),
+    (r"/profile", ProfileHandler, {}),
+]
+
+_metrics_server = None
+
+
+def start_metrics_server(port):
+    """
+    Serves ROUTES on a local port of the running (Panel) event loop,
+    only once per process.
+    """
+
+    global _metrics_server
+
+    if _metrics_server is None:
+        _metrics_server = Application(ROUTES).listen(port, address="127.0.0.1")
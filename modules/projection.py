@@ -0,0 +1,58 @@
+"""
+Reprojection of lon/lat (EPSG:4326) arrays to Web Mercator (EPSG:3857).
+
+EPSG:3857 is a spherical Mercator, whose forward projection is closed-form:
+it is computed here with NumPy over whole arrays, so that PROJ (pyproj) is
+not needed to decode the feeds (loading it is the most expensive step of
+the browser build startup). pyproj is still used if requested, and to
+validate the NumPy projection (see benchmarks/bench_projection.py).
+"""
+
+import numpy as np
+
+# Radius of the Web Mercator sphere (the WGS84 semi-major axis, meters)
+EARTH_RADIUS = 6378137.0
+
+# Default reprojection method: "numpy" (closed-form) or "pyproj"
+PROJECTION = "numpy"
+
+# pyproj transformer, created on first use
+pyproj_transformer = {}
+
+
+def get_transformer():
+    """
+    Returns the pyproj transformer from EPSG:4326 to EPSG:3857.
+    """
+
+    if "transformer" not in pyproj_transformer:
+        from pyproj import Transformer
+
+        pyproj_transformer["transformer"] = Transformer.from_crs(4326, 3857, always_xy=True)
+    return pyproj_transformer["transformer"]
+
+
+def lonlat_to_web_mercator(longitudes, latitudes):
+    """
+    Projects lon/lat arrays (degrees, longitudes within [-180, 180]) to
+    Web Mercator x/y arrays (meters). NaNs are kept.
+    """
+
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    x = EARTH_RADIUS * np.radians(longitudes)
+    with np.errstate(divide="ignore"):
+        y = EARTH_RADIUS * np.arctanh(np.sin(np.radians(latitudes)))
+    return x, y
+
+
+def to_web_mercator(longitudes, latitudes, method=PROJECTION):
+    """
+    Projects lon/lat arrays to Web Mercator x/y arrays (meters),
+    with NumPy ("numpy") or PROJ ("pyproj").
+    """
+
+    if method == "pyproj":
+        x, y = get_transformer().transform(longitudes, latitudes)
+        return np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    return lonlat_to_web_mercator(longitudes, latitudes)
@@ -0,0 +1,38 @@
+"""
+Rasterized (datashader) rendering of the stream layers for dense views.
+Requires datashader.
+"""
+
+import datashader as ds
+from holoviews.operation import apply_when
+from holoviews.operation.datashader import dynspread, rasterize
+
+from modules.metrics import timed
+
+
+class timed_rasterize(rasterize):
+    """
+    rasterize operation that records the render time of each frame.
+    """
+
+    def _process(self, element, key=None):
+        with timed("rasterize"):
+            return super()._process(element, key)
+
+
+def rasterize_when_dense(points, column, threshold, **image_opts):
+    """
+    Rasterizes the points (coloring each pixel by the highest code of `column`)
+    when more than `threshold` points are in the current view, otherwise
+    the points in view are drawn as vector glyphs.
+    """
+
+    def rasterize_points(points):
+        image = timed_rasterize(points, aggregator=ds.max(column))
+        return dynspread(image).opts(**image_opts)
+
+    return apply_when(
+        points,
+        operation=rasterize_points,
+        predicate=lambda points: len(points) > threshold,
+    )
@@ -1,179 +1,186 @@
-import pandas as pd
-import requests
-from google.transit import gtfs_realtime_pb2
-from modules.colors import IN_TRANSIT_CL, LATE_CL, ON_TIME_CL, STOPPED_CL
-from modules.constants import CORS_GTFS_TRIP_UPDATES, CORS_GTFS_VEHICLE_POS
-from modules.time_utils import timestamp_to_hms
-from pyproj import Transformer
-
-# Vehicle Dataframe columns
-VEHICLE_DF_COLUMNS = [
-    "x",
-    "y",
-    "vehicleID",
-    "tripID",
-    "startTime",
-    "lastUpdate",
-    "currentStatus",
-    "currentStatusClass",
-    "statusColor",
-]
-
-# Delay Dataframe columns
-DELAY_DF_COLUMNS = [
-    "tripID",
-    "delay",
-    "delayClass",
-    "delayColor",
-]
+"""
+Roma mobilità GTFS-RT feed for the server app: the feeds are read with
+blocking HTTP requests (see modules.fetch) and decoded by the shared core
+(modules.gtfs_rt_core), whose names are re-exported here.
+"""
 
-VEHICLE_DF_SCHEMA = pd.DataFrame([], columns=VEHICLE_DF_COLUMNS)
+from concurrent.futures import ThreadPoolExecutor, wait
 
-DELAY_DF_SCHEMA = pd.DataFrame([], columns=DELAY_DF_COLUMNS)
+from modules.constants import CORS_GTFS_TRIP_UPDATES, CORS_GTFS_VEHICLE_POS
+from modules.fetch import fetch_feed, invalidate
+from modules.gtfs_rt_core import (  # noqa: F401
+    DELAY_CLASSES,
+    DELAY_COLORS,
+    DELAY_DF_COLUMNS,
+    DELAY_DF_SCHEMA,
+    FULL_DF_SCHEMA,
+    JOIN_HOW,
+    MAX_STOP_UPDATES,
+    STATUS_CLASSES,
+    STATUS_COLORS,
+    VEHICLE_DF_COLUMNS,
+    VEHICLE_DF_SCHEMA,
+    DelayIndex,
+    SnapshotJoiner,
+    decode_delay_feed,
+    decode_stop_time_updates,
+    decode_vehicle_feed,
+    get_current_status_code,
+    get_delay_code,
+    get_trip_delays,
+    get_vehicle_positions,
+    parse_feed,
+)
+from modules.metrics import timed
+from modules.spatial import GridIndex
+
+# Fetches the vehicle positions and trip updates feeds concurrently
+feed_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gtfs-rt")
+
+# Joins the latest decoded frame of each feed, reused while the feed is unchanged
+JOINER = SnapshotJoiner()
+latest_frames = JOINER.frames
+
+# The trip updates of the latest tick
+DELAY_INDEX = JOINER.delay_index
+
+# Spatial index of the latest snapshot returned by get_data
+latest_index = {"snapshot": (None, None)}
+
+
+def build_url():
+    """
+    Build the request urls. The urls are stable, so that conditional
+    requests (ETag/Last-Modified) can be used.
+    """
 
-FULL_DF_SCHEMA = VEHICLE_DF_SCHEMA.merge(DELAY_DF_SCHEMA, on="tripID")
+    vehicle_url = CORS_GTFS_VEHICLE_POS
+    trip_url = CORS_GTFS_TRIP_UPDATES
 
-# A transformer that converts coordinates from EPSG:4326 to EPSG:3857
-transformer = Transformer.from_crs(4326, 3857, always_xy=True)
+    return (vehicle_url, trip_url)
 
 
-def build_url(cache_bust):
+class HttpFeedSource:
     """
-    Get the current local time and build the request url
+    Reads the raw vehicle ("vehicle") and trip updates ("trip") feeds
+    from Roma mobilità (or from other urls, e.g. a stub server).
     """
 
-    vehicle_url = CORS_GTFS_VEHICLE_POS + f"?cacheBust={cache_bust}"
-    trip_url = CORS_GTFS_TRIP_UPDATES + f"?cacheBust={cache_bust}"
+    def __init__(self, urls=None):
+        self.urls = dict(zip(("vehicle", "trip"), urls or build_url()))
 
-    return (vehicle_url, trip_url)
+    def read(self, feed):
+        """
+        Returns the raw content of the feed, None if it is unchanged.
+        """
 
+        return fetch_feed(self.urls[feed])
 
-def get_vehicle_position(entity):
-    """
-    Returns the xy position of the processed entity.
-    """
+    def invalidate(self, feed):
+        """
+        Forces the next read of the feed to return its content.
+        """
 
-    coords = transformer.transform(
-        entity.vehicle.position.longitude, entity.vehicle.position.latitude
-    )
-    return coords
+        invalidate(self.urls[feed])
 
 
-def get_current_status_color(current_status):
+# Default feed source
+HTTP_SOURCE = HttpFeedSource()
+
+
+def read_feed(source, feed, recorder=None):
     """
-    Returns the color of the entity according to the status
-    of the vehicle (In transit/Stopped).
+    Reads a feed from the source and returns the parsed FeedMessage
+    (None if the feed is unchanged). Raw payloads are archived by the
+    recorder, if any.
     """
 
-    return STOPPED_CL if current_status == 1 else IN_TRANSIT_CL
+    with timed(f"fetch_{feed}"):
+        response = source.read(feed)
+    if response is None:
+        return None
+    if recorder is not None:
+        recorder.record(feed, response)
+
+    try:
+        with timed(f"parse_{feed}"):
+            return parse_feed(response)
+    except Exception:
+        source.invalidate(feed)
+        raise
 
 
-def get_current_status_class(current_status):
+def get_vehicle_data(source=HTTP_SOURCE, recorder=None):
     """
-    Returns the Vehicle current status (In transit/Stopped).
+    Reads the vehicle position feed and returns a pandas DataFrame
+    (None if the feed is unchanged).
     """
 
-    return "Stopped" if current_status == 1 else "In Transit"
+    vehicle_feed = read_feed(source, "vehicle", recorder)
+    if vehicle_feed is None:
+        return None
+    with timed("decode_vehicle"):
+        return decode_vehicle_feed(vehicle_feed)
 
 
-def get_delay_color(delay):
+def get_delay_data(source=HTTP_SOURCE, recorder=None):
     """
-    Returns the color of the entity according to the delay class.
+    Reads the trip updates feed and returns a pandas DataFrame
+    (None if the feed is unchanged).
     """
 
-    if delay <= 0:
-        return ON_TIME_CL
-    else:
-        return LATE_CL
+    trip_update_feed = read_feed(source, "trip", recorder)
+    if trip_update_feed is None:
+        return None
+    with timed("decode_trip"):
+        return decode_delay_feed(trip_update_feed)
 
 
-def get_delay_class(delay):
+def get_data(source=HTTP_SOURCE, recorder=None, how=JOIN_HOW, static=None):
     """
-    Returns the delay class (Late or On time).
+    This function reads the Roma mobilità GTFS-RT feed
+    (or a replay of it, see modules.feed_archive)
+    and returns a pandas DataFrame, or None if neither
+    feed changed since the previous call.
+    Vehicles are enriched with the route name and the
+    headsign of their trip if the static GTFS is given.
     """
 
-    if delay <= 0:
-        return "On time"
-    else:
-        return "Late"
-
-
-def get_vehicle_data(url):
-    """Reads the vehicle position feed and returns a pandas DataFrame"""
-
-    vehicle_feed = gtfs_realtime_pb2.FeedMessage()
-
-    # TODO: Retry at least 5 times if the response is empty
-    response = requests.get(url).content
-    vehicle_feed.ParseFromString(response)
-
-    # Entities
-    vehicle_entities = vehicle_feed.entity
-
-    positions = []
-    for entity in vehicle_entities:
-        # Vehicle attributes
-        x, y = get_vehicle_position(entity)
-        vehicle_id = entity.vehicle.vehicle.id
-        trip_id = entity.vehicle.trip.trip_id.strip()
-        start_time = entity.vehicle.trip.start_time
-        last_update = timestamp_to_hms(entity.vehicle.timestamp)
-        current_status = entity.vehicle.current_status
-        current_status_class = get_current_status_class(current_status)
-        vehicle_color = get_current_status_color(current_status)
-
-        positions.append(
-            [
-                x,
-                y,
-                vehicle_id,
-                trip_id,
-                start_time,
-                last_update,
-                current_status,
-                current_status_class,
-                vehicle_color,
-            ]
-        )
-
-    data = pd.DataFrame(positions, columns=VEHICLE_DF_COLUMNS)
-    return data
-
-
-def get_delay_data(url):
-    """Reads the trip updates feed and returns a pandas DataFrame"""
-
-    trip_update_feed = gtfs_realtime_pb2.FeedMessage()
-
-    # TODO: Retry at least 5 times if the response is empty
-    response = requests.get(url).content
-    trip_update_feed.ParseFromString(response)
-
-    # Entities
-    trip_update_entities = trip_update_feed.entity
-
-    delays = []
-    for entity in trip_update_entities:
-        trip_id = entity.trip_update.trip.trip_id.strip()
-        current_stop_arrival = entity.trip_update.stop_time_update[0].arrival
-        current_stop_delay = current_stop_arrival.delay / 60
-        delay_class = get_delay_class(current_stop_delay)
-        delay_color = get_delay_color(current_stop_delay)
-        delays.append([trip_id, current_stop_delay, delay_class, delay_color])
-    data = pd.DataFrame(delays, columns=DELAY_DF_COLUMNS)
-    return data
-
-
-def get_data(cache_bust):
+    vehicle_future = feed_executor.submit(get_vehicle_data, source, recorder)
+    delay_future = feed_executor.submit(get_delay_data, source, recorder)
+    try:
+        vehicle_data = vehicle_future.result()
+        delay_data = delay_future.result()
+
+        # Join vehicle and delay data
+        with timed("merge"):
+            full_data = JOINER.update(vehicle_data, delay_data, how)
+    except Exception:
+        # The frame of the feed that was read is discarded: forget the
+        # validators of both feeds, so that the next tick reads them again
+        wait((vehicle_future, delay_future))
+        source.invalidate("vehicle")
+        source.invalidate("trip")
+        raise
+    if full_data is None:
+        return None
+
+    if static is not None:
+        with timed("enrich"):
+            full_data = static.enrich(full_data)
+
+    get_spatial_index(full_data)
+    return full_data
+
+
+def get_spatial_index(data):
     """
-    This function reads the Roma mobilità GTFS-RT feed
-    and returns a pandas DataFrame.
+    Returns the spatial index of a snapshot (built once per snapshot).
     """
 
-    vehicle_url, trip_url = build_url(cache_bust)
-    vehicle_data = get_vehicle_data(vehicle_url)
-    delay_data = get_delay_data(trip_url)
-
-    # Merge vehicle and delay dataframe
-    full_data = vehicle_data.merge(delay_data, on="tripID")
-    return full_data
+    snapshot, index = latest_index["snapshot"]
+    if snapshot is not data:
+        with timed("spatial_index"):
+            index = GridIndex(data["x"].to_numpy(float), data["y"].to_numpy(float))
+        latest_index["snapshot"] = (data, index)
+    return index
@@ -0,0 +1,167 @@
+"""
+Spatial index of the vehicle positions (EPSG:3857).
+
+A uniform grid: the vehicles are sorted by cell, so that the vehicles of
+a row of cells are a contiguous slice of the sorted positions. Used to
+cull the vehicles outside the viewport of a session, and for nearest
+vehicle and point-in-area queries.
+"""
+
+import numpy as np
+
+# Side of the grid cells (meters)
+CELL_SIZE = 500
+
+
+class GridIndex:
+    """
+    Uniform grid index over the x/y coordinates of a snapshot. Queries
+    return the positions (rows) of the matching vehicles, in ascending order.
+    Vehicles without a position are not indexed.
+    """
+
+    def __init__(self, x, y, cell_size=CELL_SIZE):
+        self.x = np.asarray(x, float)
+        self.y = np.asarray(y, float)
+        self.cell_size = cell_size
+
+        valid = np.flatnonzero(np.isfinite(self.x) & np.isfinite(self.y))
+        if len(valid):
+            self.x0 = self.x[valid].min()
+            self.y0 = self.y[valid].min()
+            self.nx = int((self.x[valid].max() - self.x0) // cell_size) + 1
+            self.ny = int((self.y[valid].max() - self.y0) // cell_size) + 1
+        else:
+            self.x0 = self.y0 = 0.0
+            self.nx = self.ny = 0
+
+        cells = self.get_cells(self.x[valid], self.y[valid])
+        order = np.argsort(cells, kind="stable")
+        self.rows = valid[order]
+        self.cells = cells[order]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get_cells(self, x, y):
+        ix = ((x - self.x0) // self.cell_size).astype(np.int64)
+        iy = ((y - self.y0) // self.cell_size).astype(np.int64)
+        return iy * self.nx + ix
+
+    def get_candidates(self, x0, y0, x1, y1):
+        """
+        Returns the rows of the vehicles in the cells overlapping a box.
+        """
+
+        ix0 = max(int((x0 - self.x0) // self.cell_size), 0)
+        iy0 = max(int((y0 - self.y0) // self.cell_size), 0)
+        ix1 = min(int((x1 - self.x0) // self.cell_size), self.nx - 1)
+        iy1 = min(int((y1 - self.y0) // self.cell_size), self.ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return self.rows[:0]
+
+        # One contiguous slice of the sorted rows per row of cells
+        first_cells = np.arange(iy0, iy1 + 1) * self.nx
+        starts = np.searchsorted(self.cells, first_cells + ix0, "left")
+        ends = np.searchsorted(self.cells, first_cells + ix1, "right")
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.rows[offsets + np.arange(lengths.sum())]
+
+    def query_box(self, x0, y0, x1, y1):
+        """
+        Returns the rows of the vehicles inside a box.
+        """
+
+        rows = self.get_candidates(x0, y0, x1, y1)
+        x, y = self.x[rows], self.y[rows]
+        inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        return np.sort(rows[inside])
+
+    def nearest(self, x, y, k=1):
+        """
+        Returns the rows of the `k` vehicles nearest to a point and their
+        distances, nearest first.
+        """
+
+        k = min(k, len(self))
+        radius = self.cell_size
+        max_radius = self.cell_size * np.hypot(self.nx, self.ny) + np.hypot(
+            x - self.x0, y - self.y0
+        )
+        while True:
+            rows = self.get_candidates(x - radius, y - radius, x + radius, y + radius)
+            distances = np.hypot(self.x[rows] - x, self.y[rows] - y)
+            if len(rows) >= k:
+                nearest = np.argsort(distances, kind="stable")[:k]
+                # Exact only if no vehicle outside the box can be nearer
+                if k == 0 or distances[nearest[-1]] <= radius or radius >= max_radius:
+                    return rows[nearest], distances[nearest]
+                radius = distances[nearest[-1]]
+            else:
+                radius *= 2
+
+    def query_polygon(self, polygon_x, polygon_y):
+        """
+        Returns the rows of the vehicles inside a polygon (even-odd rule;
+        rings separated by NaNs, as in the paths of the basemap).
+        """
+
+        polygon_x = np.asarray(polygon_x, float)
+        polygon_y = np.asarray(polygon_y, float)
+        rows = self.query_box(
+            np.nanmin(polygon_x), np.nanmin(polygon_y), np.nanmax(polygon_x), np.nanmax(polygon_y)
+        )
+        inside = points_in_polygon(self.x[rows], self.y[rows], polygon_x, polygon_y)
+        return rows[inside]
+
+
+def points_in_polygon(x, y, polygon_x, polygon_y):
+    """
+    Returns whether each point is inside the polygon (ray casting).
+    """
+
+    # Edges between consecutive vertices (none across the NaN separators)
+    ax, ay = polygon_x[:-1], polygon_y[:-1]
+    bx, by = polygon_x[1:], polygon_y[1:]
+    edges = np.isfinite(ax) & np.isfinite(bx)
+
+    inside = np.zeros(len(x), bool)
+    for ax, ay, bx, by in zip(ax[edges], ay[edges], bx[edges], by[edges]):
+        crosses = (ay > y) != (by > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = ax + (y - ay) * (bx - ax) / (by - ay)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def cull(data, index, box):
+    """
+    Returns the vehicles of a snapshot inside a box (x0, y0, x1, y1),
+    all of them if the box is None.
+    """
+
+    if box is None:
+        return data
+    return data.iloc[index.query_box(*box)]
+
+
+def get_box(x_range, y_range, margin=0.5):
+    """
+    Returns the box of a viewport, enlarged by `margin` (share of its size)
+    on each side.
+    """
+
+    dx = (x_range[1] - x_range[0]) * margin
+    dy = (y_range[1] - y_range[0]) * margin
+    return (x_range[0] - dx, y_range[0] - dy, x_range[1] + dx, y_range[1] + dy)
+
+
+def contains(outer, inner):
+    """
+    Returns whether a box contains another one.
+    """
+
+    return (
+        outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+    )
@@ -0,0 +1,216 @@
+"""
+Static GTFS (routes, trips, stops, stop_times, shapes) of Roma mobilità.
+
+The GTFS zip is ingested once into an on-disk columnar cache (one .npy
+file per column, strings as fixed-width arrays and references between
+tables as integer positions), which is then memory-mapped at startup.
+
+    python -m modules.static_gtfs [GTFS zip path or url]
+"""
+
+import io
+import os
+import sys
+import zipfile
+
+import numpy as np
+import pandas as pd
+import requests
+
+from modules.constants import STATIC_GTFS, STATIC_GTFS_CACHE
+from modules.projection import to_web_mercator
+
+
+def read_table(gtfs_zip, name, columns):
+    """
+    Reads the requested columns of a GTFS table (all as strings but the
+    coordinates). Returns None if the table is missing.
+    """
+
+    if f"{name}.txt" not in gtfs_zip.namelist():
+        return None
+
+    with gtfs_zip.open(f"{name}.txt") as f:
+        table = pd.read_csv(
+            f,
+            usecols=lambda column: column in columns,
+            dtype=str,
+            keep_default_na=False,
+        )
+    for column in columns:
+        if column not in table:
+            table[column] = ""
+    return table
+
+
+def get_positions(keys, values):
+    """
+    Returns the positions of the values in the keys array (-1 if missing).
+    """
+
+    return pd.Index(keys).get_indexer(values).astype(np.int32)
+
+
+def build_cache(gtfs_path, cache_dir=STATIC_GTFS_CACHE):
+    """
+    Converts a static GTFS zip (path or url) into the columnar cache.
+    """
+
+    if gtfs_path.startswith(("http://", "https://")):
+        gtfs_file = io.BytesIO(requests.get(gtfs_path, timeout=60).content)
+    else:
+        gtfs_file = gtfs_path
+
+    with zipfile.ZipFile(gtfs_file) as gtfs_zip:
+        routes = read_table(
+            gtfs_zip, "routes", ["route_id", "route_short_name", "route_long_name"]
+        )
+        trips = read_table(
+            gtfs_zip, "trips", ["trip_id", "route_id", "trip_headsign", "shape_id"]
+        )
+        stops = read_table(gtfs_zip, "stops", ["stop_id", "stop_name", "stop_lat", "stop_lon"])
+        stop_times = read_table(
+            gtfs_zip, "stop_times", ["trip_id", "stop_id", "stop_sequence"]
+        )
+        shapes = read_table(
+            gtfs_zip,
+            "shapes",
+            ["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"],
+        )
+
+    columns = {}
+
+    # Routes
+    for column in ("route_id", "route_short_name", "route_long_name"):
+        columns[f"routes.{column}"] = routes[column].to_numpy(dtype=str)
+
+    # Stops (EPSG:3857)
+    stop_ids = stops["stop_id"].to_numpy(dtype=str)
+    stop_x, stop_y = to_web_mercator(
+        pd.to_numeric(stops["stop_lon"]).to_numpy(),
+        pd.to_numeric(stops["stop_lat"]).to_numpy(),
+    )
+    columns["stops.stop_id"] = stop_ids
+    columns["stops.stop_name"] = stops["stop_name"].to_numpy(dtype=str)
+    columns["stops.x"] = np.asarray(stop_x)
+    columns["stops.y"] = np.asarray(stop_y)
+
+    # Shapes (EPSG:3857), sorted by shape and sequence
+    shape_ids = np.array([], dtype=str)
+    if shapes is not None:
+        shapes["shape_pt_sequence"] = pd.to_numeric(shapes["shape_pt_sequence"])
+        shapes = shapes.sort_values(["shape_id", "shape_pt_sequence"])
+        shape_ids, shape_index = np.unique(shapes["shape_id"].to_numpy(dtype=str), return_inverse=True)
+        shape_x, shape_y = to_web_mercator(
+            pd.to_numeric(shapes["shape_pt_lon"]).to_numpy(),
+            pd.to_numeric(shapes["shape_pt_lat"]).to_numpy(),
+        )
+        columns["shapes.offsets"] = np.searchsorted(shape_index, np.arange(len(shape_ids) + 1))
+        columns["shapes.x"] = np.asarray(shape_x)
+        columns["shapes.y"] = np.asarray(shape_y)
+    columns["shapes.shape_id"] = shape_ids
+
+    # Trips
+    trip_ids = trips["trip_id"].to_numpy(dtype=str)
+    columns["trips.trip_id"] = trip_ids
+    columns["trips.trip_headsign"] = trips["trip_headsign"].to_numpy(dtype=str)
+    columns["trips.route_index"] = get_positions(columns["routes.route_id"], trips["route_id"])
+    columns["trips.shape_index"] = get_positions(shape_ids, trips["shape_id"])
+
+    # Stop times, sorted by trip and sequence
+    if stop_times is not None:
+        stop_times["trip_index"] = get_positions(trip_ids, stop_times["trip_id"])
+        stop_times["stop_sequence"] = pd.to_numeric(stop_times["stop_sequence"])
+        stop_times = stop_times.sort_values(["trip_index", "stop_sequence"])
+        trip_index = stop_times["trip_index"].to_numpy()
+        columns["stop_times.offsets"] = np.searchsorted(trip_index, np.arange(len(trip_ids) + 1))
+        columns["stop_times.stop_index"] = get_positions(stop_ids, stop_times["stop_id"])
+        columns["stop_times.stop_sequence"] = stop_times["stop_sequence"].to_numpy(np.int32)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, values in columns.items():
+        np.save(os.path.join(cache_dir, f"{name}.npy"), values)
+
+
+class StaticGTFS:
+    """
+    Memory-mapped static GTFS cache with O(1) lookups by trip_id and stop_id.
+    """
+
+    def __init__(self, cache_dir=STATIC_GTFS_CACHE):
+        self.columns = {}
+        for file_name in os.listdir(cache_dir):
+            if file_name.endswith(".npy"):
+                self.columns[file_name[:-4]] = np.load(
+                    os.path.join(cache_dir, file_name), mmap_mode="r"
+                )
+
+        # Hash tables of the ids
+        self.trip_index = pd.Index(self.columns["trips.trip_id"])
+        self.stop_index = pd.Index(self.columns["stops.stop_id"])
+
+    def get_trips(self, trip_ids):
+        """
+        Returns the route short names and the headsigns of the trips
+        ("" if the trip is unknown).
+        """
+
+        if not len(self.trip_index):
+            return np.full(len(trip_ids), ""), np.full(len(trip_ids), "")
+
+        trips = self.trip_index.get_indexer(trip_ids)
+        routes = np.asarray(self.columns["trips.route_index"])[trips]
+        found = (trips >= 0) & (routes >= 0)
+
+        route_names = np.asarray(self.columns["routes.route_short_name"])[routes]
+        headsigns = np.asarray(self.columns["trips.trip_headsign"])[trips]
+        return np.where(found, route_names, ""), np.where(trips >= 0, headsigns, "")
+
+    def get_stop_coords(self, stop_ids):
+        """
+        Returns the (EPSG:3857) coordinates of the stops (NaN if unknown).
+        """
+
+        if not len(self.stop_index):
+            return np.full(len(stop_ids), np.nan), np.full(len(stop_ids), np.nan)
+
+        stops = self.stop_index.get_indexer(stop_ids)
+        x = np.where(stops >= 0, np.asarray(self.columns["stops.x"])[stops], np.nan)
+        y = np.where(stops >= 0, np.asarray(self.columns["stops.y"])[stops], np.nan)
+        return x, y
+
+    def get_shape(self, trip_id):
+        """
+        Returns the (EPSG:3857) path of the shape of a trip, None if unknown.
+        """
+
+        trip = self.trip_index.get_indexer([trip_id])[0]
+        if trip < 0 or "shapes.offsets" not in self.columns:
+            return None
+        shape = self.columns["trips.shape_index"][trip]
+        if shape < 0:
+            return None
+        start, end = self.columns["shapes.offsets"][shape : shape + 2]
+        return self.columns["shapes.x"][start:end], self.columns["shapes.y"][start:end]
+
+    def enrich(self, data):
+        """
+        Adds the route name and the headsign of each vehicle trip.
+        """
+
+        data["routeName"], data["headsign"] = self.get_trips(data["tripID"])
+        return data
+
+
+def load_static_gtfs(cache_dir=STATIC_GTFS_CACHE):
+    """
+    Loads the static GTFS cache, None if it has not been built.
+    """
+
+    if not os.path.isdir(cache_dir):
+        return None
+    return StaticGTFS(cache_dir)
+
+
+if __name__ == "__main__":
+    build_cache(sys.argv[1] if len(sys.argv) > 1 else STATIC_GTFS)
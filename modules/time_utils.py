@@ -1,5 +1,7 @@
 from datetime import datetime as dt
 
+import numpy as np
+import pandas as pd
 from pytz import timezone
 
 # EU/Rome timezone
@@ -17,3 +19,15 @@ def get_current_time():
 
 def timestamp_to_hms(timestamp):
     return dt.fromtimestamp(timestamp, tz=EU_ROME_TZ).strftime("%H:%M:%S")
+
+
+def timestamps_to_hms(timestamps):
+    """
+    Vectorized version of timestamp_to_hms for an array of POSIX timestamps.
+    Vehicles report within a few seconds of each other, so only the unique
+    timestamps are formatted.
+    """
+
+    unique_ts, inverse = np.unique(timestamps, return_inverse=True)
+    local_times = pd.to_datetime(unique_ts, unit="s", utc=True).tz_convert(EU_ROME_TZ)
+    return np.asarray(local_times.strftime("%H:%M:%S"), dtype=object)[inverse]
@@ -0,0 +1,186 @@
+"""
+Trails of the latest positions of each vehicle.
+
+Positions are kept in preallocated ring buffers (one row per vehicle slot),
+so the memory used by the trails does not depend on the uptime: slots of
+the vehicles that left the service are recycled for the new ones.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class VehicleTrails:
+    """
+    Ring buffers of the latest `length` positions (x, y, timestamp) of up to
+    `capacity` vehicles, keyed by `vehicleID`.
+
+    A vehicle not seen for `max_idle` seconds releases its slot. When all
+    the slots are taken, the least recently seen vehicles are recycled;
+    the vehicles of a snapshot that still don't fit are not tracked.
+    """
+
+    def __init__(self, capacity=8192, length=20, max_idle=600):
+        self.capacity = capacity
+        self.length = length
+        self.max_idle = max_idle
+
+        self.x = np.full((capacity, length), np.nan)
+        self.y = np.full((capacity, length), np.nan)
+        self.t = np.full((capacity, length), np.nan)
+        self.count = np.zeros(capacity, np.int64)
+        self.last_seen = np.full(capacity, -np.inf)
+        self.vehicle_ids = np.full(capacity, None, object)
+
+        self.slots = {}
+        self.free = list(range(capacity - 1, -1, -1))
+        self.stats = {"appended": 0, "released": 0, "recycled": 0, "untracked": 0}
+
+        # Trails of the latest append (shared by all the sessions)
+        self._trails = None
+
+        self._lock = threading.Lock()
+
+    def nbytes(self):
+        """
+        Bytes used by the ring buffers.
+        """
+
+        return sum(
+            array.nbytes
+            for array in (self.x, self.y, self.t, self.count, self.last_seen, self.vehicle_ids)
+        )
+
+    def release(self, slots):
+        """
+        Clears the given slots and makes them available to new vehicles.
+        """
+
+        for slot in slots:
+            del self.slots[self.vehicle_ids[slot]]
+            self.vehicle_ids[slot] = None
+            self.free.append(slot)
+        self.x[slots] = self.y[slots] = self.t[slots] = np.nan
+        self.count[slots] = 0
+        self.last_seen[slots] = -np.inf
+
+    def get_slots(self, vehicle_ids, timestamp):
+        """
+        Returns the slots of the vehicles (-1 for the untracked ones),
+        assigning a slot to the new vehicles.
+        """
+
+        slots = np.fromiter(
+            (self.slots.get(vehicle_id, -1) for vehicle_id in vehicle_ids),
+            np.int64,
+            len(vehicle_ids),
+        )
+        self.last_seen[slots[slots >= 0]] = timestamp
+
+        new = np.flatnonzero(slots < 0)
+        missing = len(new) - len(self.free)
+        if missing > 0:
+            # Recycle the least recently seen vehicles (not in this snapshot)
+            candidates = np.flatnonzero(self.last_seen < timestamp)
+            candidates = candidates[self.vehicle_ids[candidates] != None]  # noqa: E711
+            oldest = candidates[np.argsort(self.last_seen[candidates])[:missing]]
+            self.release(oldest)
+            self.stats["recycled"] += len(oldest)
+
+        for position in new:
+            if not self.free:
+                self.stats["untracked"] += 1
+                continue
+            slot = self.free.pop()
+            self.slots[vehicle_ids[position]] = slot
+            self.vehicle_ids[slot] = vehicle_ids[position]
+            self.last_seen[slot] = timestamp
+            slots[position] = slot
+        return slots
+
+    def append(self, data, timestamp=None):
+        """
+        Appends the positions of a snapshot to the trails. A position equal
+        to the latest one of its vehicle is not appended again.
+        """
+
+        timestamp = time.time() if timestamp is None else timestamp
+        data = data.drop_duplicates("vehicleID", keep="last")
+
+        with self._lock:
+            idle = np.flatnonzero(self.last_seen < timestamp - self.max_idle)
+            idle = idle[self.vehicle_ids[idle] != None]  # noqa: E711
+            self.release(idle)
+            self.stats["released"] += len(idle)
+
+            slots = self.get_slots(data["vehicleID"].to_numpy(), timestamp)
+            tracked = slots >= 0
+            slots = slots[tracked]
+            x = data["x"].to_numpy()[tracked]
+            y = data["y"].to_numpy()[tracked]
+
+            latest = (self.count[slots] - 1) % self.length
+            moved = (
+                (self.count[slots] == 0)
+                | (self.x[slots, latest] != x)
+                | (self.y[slots, latest] != y)
+            )
+            slots, x, y = slots[moved], x[moved], y[moved]
+
+            head = self.count[slots] % self.length
+            self.x[slots, head] = x
+            self.y[slots, head] = y
+            self.t[slots, head] = timestamp
+            self.count[slots] += 1
+            self.stats["appended"] += len(slots)
+            self._trails = None
+
+    def get_trails(self, max_age=None, now=None):
+        """
+        Returns the trails as (x, y) float32 arrays, one row per vehicle with
+        at least two positions, oldest position first (NaN if missing).
+        With `max_age` (seconds), older positions are dropped.
+        """
+
+        with self._lock:
+            if max_age is None and self._trails is not None:
+                return self._trails
+            active = np.flatnonzero(self.count > 1)
+            # Unroll the ring buffers, starting from the oldest position
+            columns = (self.count[active, None] + np.arange(self.length)) % self.length
+            rows = active[:, None]
+            x, y, t = self.x[rows, columns], self.y[rows, columns], self.t[rows, columns]
+
+            if max_age is not None:
+                now = time.time() if now is None else now
+                old = t < now - max_age
+                x[old] = y[old] = np.nan
+
+            trails = (x.astype(np.float32), y.astype(np.float32))
+            if max_age is None:
+                self._trails = trails
+        return trails
+
+    def get_paths(self, max_age=None, now=None, box=None):
+        """
+        Returns the trails as a single NaN-separated path ({"x": ..., "y": ...},
+        float32). With `box` (x0, y0, x1, y1), only the trails of the vehicles
+        whose latest position is inside the box are returned.
+        """
+
+        x, y = self.get_trails(max_age, now)
+        if box is not None:
+            # The latest position is in the last column
+            latest_x, latest_y = x[:, -1], y[:, -1]
+            inside = (
+                (latest_x >= box[0])
+                & (latest_x <= box[2])
+                & (latest_y >= box[1])
+                & (latest_y <= box[3])
+            )
+            x, y = x[inside], y[inside]
+
+        gap = np.full((len(x), 1), np.nan, np.float32)
+        return {"x": np.hstack([x, gap]).ravel(), "y": np.hstack([y, gap]).ravel()}
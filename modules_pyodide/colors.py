@@ -1,10 +0,0 @@
-# Custom colors
-HEADER_CL = "#2F4F4F"
-
-# Vehicle status colors
-IN_TRANSIT_CL = "#0077BB"
-STOPPED_CL = "#EE7733"
-
-# Delay class colors
-ON_TIME_CL = "#009988"
-LATE_CL = "#CC3311"
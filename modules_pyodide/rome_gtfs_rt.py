@@ -1,40 +1,35 @@
-import pandas as pd
-from colors import IN_TRANSIT_CL, LATE_CL, ON_TIME_CL, STOPPED_CL
+"""
+Roma mobilità GTFS-RT feed for the browser build: the feeds are fetched
+with the fetch API (pyodide.http) and decoded by the shared core
+(gtfs_rt_core, loaded from modules/).
+"""
+
+import asyncio
+
+import numpy as np
 from constants import CORS_GTFS_TRIP_UPDATES, CORS_GTFS_VEHICLE_POS
-from google.transit import gtfs_realtime_pb2
-from js import XMLHttpRequest
-from pyproj import Transformer
-from time_utils import timestamp_to_hms
-
-# Vehicle Dataframe columns
-VEHICLE_DF_COLUMNS = [
-    "x",
-    "y",
-    "vehicleID",
-    "tripID",
-    "startTime",
-    "lastUpdate",
-    "currentStatus",
-    "currentStatusClass",
-    "statusColor",
-]
-
-# Delay Dataframe columns
-DELAY_DF_COLUMNS = [
-    "tripID",
-    "delay",
-    "delayClass",
-    "delayColor",
-]
-
-VEHICLE_DF_SCHEMA = pd.DataFrame([], columns=VEHICLE_DF_COLUMNS)
-
-DELAY_DF_SCHEMA = pd.DataFrame([], columns=DELAY_DF_COLUMNS)
-
-FULL_DF_SCHEMA = VEHICLE_DF_SCHEMA.merge(DELAY_DF_SCHEMA, on="tripID")
-
-# Converts coordinates from EPSG:4326 to EPSG:3857
-transformer = Transformer.from_crs(4326, 3857, always_xy=True)
+from gtfs_rt_core import (  # noqa: F401
+    DELAY_CLASSES,
+    DELAY_COLORS,
+    STATUS_CLASSES,
+    STATUS_COLORS,
+    SnapshotJoiner,
+    decode_snapshot,
+)
+from gtfs_rt_core import FULL_DF_SCHEMA as CORE_DF_SCHEMA
+from pyodide.http import pyfetch
+
+# Compact dtypes of the columns sent to the main thread (binary buffers)
+COMPACT_DTYPES = {"x": np.float32, "y": np.float32, "statusCode": np.int8, "delayCode": np.int8}
+
+FULL_DF_SCHEMA = CORE_DF_SCHEMA.astype(COMPACT_DTYPES)
+
+# Joins the latest decoded frame of each feed
+JOINER = SnapshotJoiner()
+
+# Attempts per feed request, and delay before a new attempt (seconds)
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 0.5
 
 
 def build_url(cache_bust):
@@ -48,149 +43,59 @@ def build_url(cache_bust):
     return (vehicle_url, trip_url)
 
 
-def read_feed_xhr(url):
+async def read_feed(url):
     """
     HTTP request used to retrieve binary data from
-    Roma mobilità GTFS-RT feed (XHR).
-    Adapted from: https://bartbroere.eu/2022/04/25/pyodide-requests-binary-works-update/
-    """
-
-    xhr = XMLHttpRequest.new()
-    xhr.open("GET", url, False)
-    xhr.overrideMimeType("text/plain; charset=x-user-defined")
-    xhr.responseIsBinary = True
-    xhr.send(None)
-
-    response = xhr.response
-
-    return bytes(ord(byte) & 0xFF for byte in response)
-
-
-def get_vehicle_position(entity):
-    """
-    Returns the xy position of the processed entity.
+    Roma mobilità GTFS-RT feed (fetch API, non-blocking).
+    The response ArrayBuffer is copied into bytes at once.
+    Network errors, server errors (5xx) and empty responses are retried
+    up to MAX_ATTEMPTS times. Returns None if the feed could not be read.
     """
 
-    coords = transformer.transform(
-        entity.vehicle.position.longitude, entity.vehicle.position.latitude
-    )
-    return coords
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(RETRY_DELAY * attempt)
+        try:
+            response = await pyfetch(url)
+        except OSError:
+            continue
+        if response.ok:
+            payload = await response.bytes()
+            if payload:
+                return payload
+        elif response.status < 500:
+            return None
+    return None
 
 
-def get_current_status_color(current_status):
+async def fetch_feeds(vehicle_url, trip_url):
     """
-    Returns the color of the entity according to the status
-    of the vehicle (In transit/Stopped).
+    Fetches the vehicle positions and trip updates feeds concurrently
+    (None for a feed that could not be read).
     """
 
-    return STOPPED_CL if current_status == 1 else IN_TRANSIT_CL
+    return await asyncio.gather(read_feed(vehicle_url), read_feed(trip_url))
 
 
-def get_current_status_class(current_status):
+def decode_data(vehicle_response, trip_response):
     """
-    Returns the Vehicle current status (In transit/Stopped).
+    Decodes the raw feeds and returns a pandas DataFrame. A feed that
+    could not be read (None) keeps its latest frame; if neither could,
+    the DataFrame is empty (the dashboard keeps the map and shows an alert).
     """
 
-    return "Stopped" if current_status == 1 else "In Transit"
+    full_data = decode_snapshot(JOINER, vehicle_response, trip_response)
+    if full_data is None:
+        return FULL_DF_SCHEMA
+    return full_data.astype(COMPACT_DTYPES)
 
 
-def get_delay_color(delay):
-    """
-    Returns the color of the entity according to the delay class.
-    """
-
-    if delay <= 0:
-        return ON_TIME_CL
-    else:
-        return LATE_CL
-
-
-def get_delay_class(delay):
-    """
-    Returns the delay class (Late or On time).
-    """
-
-    if delay <= 0:
-        return "On time"
-    else:
-        return "Late"
-
-
-def get_vehicle_data(url):
-    """Reads the vehicle position feed and returns a pandas DataFrame"""
-
-    vehicle_feed = gtfs_realtime_pb2.FeedMessage()
-
-    # TODO: Retry at least 5 times if the response is empty
-    response = read_feed_xhr(url)
-    vehicle_feed.ParseFromString(response)
-
-    # Entities
-    vehicle_entities = vehicle_feed.entity
-
-    positions = []
-    for entity in vehicle_entities:
-        # Vehicle attributes
-        x, y = get_vehicle_position(entity)
-        vehicle_id = entity.vehicle.vehicle.id
-        trip_id = entity.vehicle.trip.trip_id.strip()
-        start_time = entity.vehicle.trip.start_time
-        last_update = timestamp_to_hms(entity.vehicle.timestamp)
-        current_status = entity.vehicle.current_status
-        current_status_class = get_current_status_class(current_status)
-        vehicle_color = get_current_status_color(current_status)
-
-        positions.append(
-            [
-                x,
-                y,
-                vehicle_id,
-                trip_id,
-                start_time,
-                last_update,
-                current_status,
-                current_status_class,
-                vehicle_color,
-            ]
-        )
-
-    data = pd.DataFrame(positions, columns=VEHICLE_DF_COLUMNS)
-    return data
-
-
-def get_delay_data(url):
-    """Reads the trip updates feed and returns a pandas DataFrame"""
-    trip_update_feed = gtfs_realtime_pb2.FeedMessage()
-
-    # TODO: Retry at least 5 times if the response is empty
-    response = read_feed_xhr(url)
-    trip_update_feed.ParseFromString(response)
-
-    # Entities
-    trip_update_entities = trip_update_feed.entity
-
-    delays = []
-    for entity in trip_update_entities:
-        trip_id = entity.trip_update.trip.trip_id.strip()
-        current_stop_arrival = entity.trip_update.stop_time_update[0].arrival
-        current_stop_delay = current_stop_arrival.delay / 60
-        delay_class = get_delay_class(current_stop_delay)
-        delay_color = get_delay_color(current_stop_delay)
-        delays.append([trip_id, current_stop_delay, delay_class, delay_color])
-    data = pd.DataFrame(delays, columns=DELAY_DF_COLUMNS)
-    return data
-
-
-def get_data(cache_bust):
+async def get_data(cache_bust):
     """
     This function reads the Roma mobilità GTFS-RT feed
     and returns a pandas DataFrame.
     """
 
     vehicle_url, trip_url = build_url(cache_bust)
-    vehicle_data = get_vehicle_data(vehicle_url)
-    delay_data = get_delay_data(trip_url)
-
-    # Merge vehicle and delay dataframe
-    full_data = vehicle_data.merge(delay_data, on="tripID")
-    return full_data
+    vehicle_response, trip_response = await fetch_feeds(vehicle_url, trip_url)
+    return decode_data(vehicle_response, trip_response)
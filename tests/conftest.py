@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# The modules and benchmarks packages are imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_feeds  # noqa: E402
+from google.transit import gtfs_realtime_pb2  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def payloads():
+    """
+    Raw (vehicle positions, trip updates) payloads of a synthetic feed.
+    """
+
+    return make_feeds(500)
+
+
+@pytest.fixture(scope="session")
+def empty_payload():
+    """
+    Raw payload of a valid feed without entities.
+    """
+
+    feed_message = gtfs_realtime_pb2.FeedMessage()
+    feed_message.header.gtfs_realtime_version = "2.0"
+    return feed_message.SerializeToString()
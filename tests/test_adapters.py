@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sys
+import types
+
+import pandas as pd
+import pytest
+from benchmarks.synthetic import MemorySource
+from modules import rome_gtfs_rt
+from modules.gtfs_rt_core import SnapshotJoiner, decode_snapshot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeResponse:
+    """
+    The parts of a pyodide.http.FetchResponse used by the browser build.
+    """
+
+    def __init__(self, payload, status=200):
+        self.payload = payload
+        self.status = status
+        self.ok = 200 <= status < 300
+
+    async def bytes(self):
+        return self.payload
+
+
+@pytest.fixture
+def pyodide_adapter(monkeypatch, payloads):
+    """
+    Imports modules_pyodide.rome_gtfs_rt as in the browser (shared modules
+    imported flat), with a pyodide.http.pyfetch answering the synthetic
+    payloads. `responses` maps each feed ("vehicle", "trip") to the
+    (payload, status) answered first, in turn; `requests` counts the calls.
+    """
+
+    responses = {"vehicle": [], "trip": []}
+    requests = {"vehicle": 0, "trip": 0}
+
+    async def pyfetch(url):
+        feed = "trip" if "trip_updates" in url else "vehicle"
+        requests[feed] += 1
+        if responses[feed]:
+            return FakeResponse(*responses[feed].pop(0))
+        return FakeResponse(payloads[feed == "trip"])
+
+    pyodide = types.ModuleType("pyodide")
+    pyodide.http = types.ModuleType("pyodide.http")
+    pyodide.http.pyfetch = pyfetch
+    monkeypatch.setitem(sys.modules, "pyodide", pyodide)
+    monkeypatch.setitem(sys.modules, "pyodide.http", pyodide.http)
+    monkeypatch.syspath_prepend(os.path.join(ROOT, "modules"))
+    monkeypatch.syspath_prepend(os.path.join(ROOT, "modules_pyodide"))
+
+    imported = set(sys.modules)
+    from modules_pyodide import rome_gtfs_rt as adapter
+
+    monkeypatch.setattr(adapter, "RETRY_DELAY", 0)
+    yield adapter, responses, requests
+    for name in set(sys.modules) - imported:
+        del sys.modules[name]
+
+
+def test_server_adapter(monkeypatch, payloads):
+    monkeypatch.setattr(rome_gtfs_rt, "JOINER", SnapshotJoiner())
+    expected = decode_snapshot(SnapshotJoiner(), *payloads, rome_gtfs_rt.JOIN_HOW)
+
+    data = rome_gtfs_rt.get_data(MemorySource(*payloads))
+
+    pd.testing.assert_frame_equal(data, expected)
+
+
+def test_pyodide_adapter(pyodide_adapter, payloads):
+    adapter, _, _ = pyodide_adapter
+    expected = decode_snapshot(SnapshotJoiner(), *payloads)
+
+    data = asyncio.run(adapter.get_data(0))
+
+    pd.testing.assert_frame_equal(data, expected.astype(adapter.COMPACT_DTYPES))
+    assert data.columns.tolist() == adapter.FULL_DF_SCHEMA.columns.tolist()
+
+
+def test_pyodide_adapter_retries(pyodide_adapter, payloads):
+    adapter, responses, requests = pyodide_adapter
+    responses["vehicle"] = [(b"", 200), (b"", 503)]
+
+    data = asyncio.run(adapter.get_data(0))
+
+    assert requests == {"vehicle": 3, "trip": 1}
+    assert len(data) == len(decode_snapshot(SnapshotJoiner(), *payloads))
+
+
+def test_pyodide_adapter_keeps_the_last_frame(pyodide_adapter):
+    adapter, responses, requests = pyodide_adapter
+    first = asyncio.run(adapter.get_data(0))
+
+    # Client errors are not retried: the trip updates keep their frame
+    responses["trip"] = [(b"", 404)]
+    pd.testing.assert_frame_equal(asyncio.run(adapter.get_data(1)), first)
+    assert requests["trip"] == 2
+
+    # Neither feed read: an empty frame (the dashboard shows an alert)
+    responses["vehicle"] = [(b"", 503)] * adapter.MAX_ATTEMPTS
+    responses["trip"] = [(b"", 404)]
+    assert asyncio.run(adapter.get_data(2)).empty
@@ -0,0 +1,26 @@
+import os
+
+from modules import basemap
+from modules.constants import ADMIN_BOUNDS
+
+
+def test_paths_do_not_depend_on_the_working_directory(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    cache_path = str(tmp_path / "RomeAdmin.npz")
+
+    levels = basemap.load_admin_bounds(cache_path=cache_path)
+
+    assert os.path.isabs(ADMIN_BOUNDS)
+    assert sorted(levels) == list(basemap.TOLERANCES)
+    assert os.path.exists(cache_path)
+
+
+def test_unwritable_cache_is_kept_in_memory(tmp_path):
+    cache_path = str(tmp_path / "missing" / "RomeAdmin.npz")
+
+    levels = basemap.load_admin_bounds(cache_path=cache_path)
+
+    assert sorted(levels) == list(basemap.TOLERANCES)
+    x, y = levels[0]
+    assert len(x) == len(y) > 0
+    assert not os.listdir(tmp_path)
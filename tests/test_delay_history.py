@@ -0,0 +1,63 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+from modules.delay_history import DelayHistory, get_delay_percentiles
+
+
+def make_snapshot(routes):
+    return pd.DataFrame(
+        {
+            "vehicleID": [str(i) for i in range(len(routes))],
+            "tripID": [f"0#{i}-0" for i in range(len(routes))],
+            "delay": [2.0] * len(routes),
+            "routeName": routes,
+        }
+    )
+
+
+def test_history_needs_the_route_names(tmp_path):
+    history = DelayHistory(str(tmp_path / "history.sqlite"))
+
+    with pytest.raises(ValueError):
+        history.append(make_snapshot(["64", "8"]).drop(columns="routeName"))
+
+
+def test_unknown_routes_are_not_counted(tmp_path):
+    path = str(tmp_path / "history.sqlite")
+    history = DelayHistory(path)
+    history.append(make_snapshot(["64", "64", ""]), observed_at=1790000000)
+
+    with sqlite3.connect(path) as connection:
+        history.flush(connection)
+        (observations,) = connection.execute("SELECT COUNT(*) FROM observations_20260921").fetchone()
+
+    assert observations == 3
+    percentiles = get_delay_percentiles(path, "20260921", "20260921")
+    assert percentiles[["route", "count", "p50"]].values.tolist() == [["64", 2, 2]]
+
+
+def test_close_flushes_the_queue(tmp_path):
+    path = str(tmp_path / "history.sqlite")
+    history = DelayHistory(path, flush_interval=3600)
+    history.append(make_snapshot(["64", "8"]), observed_at=1790000000)
+
+    history.close()
+
+    with sqlite3.connect(path) as connection:
+        (observations,) = connection.execute("SELECT COUNT(*) FROM observations_20260921").fetchone()
+    assert observations == 2
+
+
+def test_flush_is_a_single_transaction(tmp_path):
+    path = str(tmp_path / "history.sqlite")
+    history = DelayHistory(path, flush_interval=3600)
+    history.append(make_snapshot(["64"]), observed_at=1790000000)
+    # A snapshot that fails after the partition of the first one was created
+    history._queue.put((None,) + history._queue.queue[0][1:])
+
+    with sqlite3.connect(path) as connection:
+        with pytest.raises(TypeError):
+            history.flush(connection)
+        tables = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    assert tables == [("delay_histogram",)]
@@ -0,0 +1,101 @@
+import holoviews as hv
+import numpy as np
+import pandas as pd
+import pytest
+from bokeh.document import Document
+from bokeh.document.events import ColumnDataChangedEvent
+from holoviews.streams import Pipe
+from modules.delta import DeltaUpdater, align_snapshot
+
+
+def make_snapshot(vehicle_ids, x=None):
+    x = np.array([ord(vehicle_id) for vehicle_id in vehicle_ids], float) if x is None else x
+    return pd.DataFrame(
+        {
+            "x": x,
+            "y": np.zeros(len(vehicle_ids)),
+            "vehicleID": vehicle_ids,
+            "statusCode": np.zeros(len(vehicle_ids), np.int8),
+        }
+    )
+
+
+@pytest.fixture
+def rendered():
+    hv.extension("bokeh")
+    pipe = Pipe(make_snapshot([]))
+    updater = DeltaUpdater(pipe)
+    points = hv.DynamicMap(hv.Points, streams=[pipe])
+    points = points.opts(tools=["hover"], hooks=[updater.hook()])
+    document = Document()
+    plot = hv.renderer("bokeh").get_plot(points, doc=document)
+    document.add_root(plot.state)
+    return updater, plot.handles["source"]
+
+
+def test_align_hides_removed_vehicles():
+    previous = make_snapshot(list("abcdefgh"))
+    current = make_snapshot(list("bcdefghz"), x=np.arange(8) + 10.0)
+
+    aligned = align_snapshot(previous, current)
+
+    assert aligned["vehicleID"].tolist() == list("abcdefghz")
+    assert np.isnan(aligned.loc[0, "x"]) and np.isnan(aligned.loc[0, "y"])
+    np.testing.assert_array_equal(aligned["x"].iloc[1:], current["x"])
+
+
+def test_align_compacts_when_too_many_hidden():
+    previous = make_snapshot(list("abcd"))
+    assert align_snapshot(previous, make_snapshot(list("cd"))) is None
+    assert align_snapshot(previous, make_snapshot([])) is None
+
+
+def test_removed_vehicles_are_patched(rendered):
+    updater, source = rendered
+    updater.send(make_snapshot(list("abcdefgh")))
+    # b left, c moved, z appeared
+    current = make_snapshot(list("acdefghz"))
+    current.loc[1, "x"] = 20
+    updater.send(current)
+
+    assert updater.stats == {
+        "full": 1,
+        "delta": 1,
+        "patched_values": 3,
+        "replaced_columns": 0,
+        "streamed_rows": 1,
+    }
+    assert list(source.data["vehicleID"]) == list("abcdefghz")
+    visible = ~np.isnan(np.asarray(source.data["x"], float))
+    assert list(np.asarray(source.data["vehicleID"])[visible]) == list("acdefghz")
+    assert source.data["x"][2] == 20
+
+
+def test_hidden_rows_are_compacted(rendered):
+    updater, source = rendered
+    updater.send(make_snapshot(list("abcdefgh")))
+    updater.send(make_snapshot(list("cdefgh")))
+    updater.send(make_snapshot(list("defgh")))
+
+    assert updater.stats["full"] == 2
+    assert list(source.data["vehicleID"]) == list("defgh")
+
+
+def test_most_changed_columns_are_replaced(rendered):
+    updater, source = rendered
+    updater.send(make_snapshot(list("abcdefgh")))
+    # Every vehicle moved, h changed status and z appeared
+    current = make_snapshot(list("abcdefghz"), x=np.arange(9) + 0.5)
+    current.loc[7, "statusCode"] = 1
+    events = []
+    source.document.on_change(events.append)
+    updater.send(current)
+
+    assert updater.stats["full"] == 1
+    assert updater.stats["replaced_columns"] == 1
+    assert updater.stats["patched_values"] == 1
+    for column in ("x", "y", "vehicleID", "statusCode"):
+        np.testing.assert_array_equal(source.data[column], current[column])
+    # Only the changed columns are sent
+    replaced = [event for event in events if isinstance(event, ColumnDataChangedEvent)]
+    assert [event.cols for event in replaced] == [["x"]]
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from modules.feed_cache import FeedCache
+from modules.fetch import FeedUnavailableError
+
+
+def failing_loader(calls, delay=0.2):
+    def loader():
+        calls.append(time.monotonic())
+        time.sleep(delay)
+        raise FeedUnavailableError("Feed down")
+
+    return loader
+
+
+def test_failed_refresh_is_single_flight():
+    calls = []
+    cache = FeedCache(failing_loader(calls))
+
+    threads = [threading.Thread(target=cache.get) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert cache.stats["misses"] == 5
+    assert cache.stats["errors"] == 1
+
+    # A later miss tries again
+    cache.get()
+    assert len(calls) == 2
+
+
+def test_no_blocking_refresh_while_polling():
+    calls = []
+    cache = FeedCache(failing_loader(calls), ttl=3600)
+    cache.start()
+    while not cache.attempts:
+        time.sleep(0.01)
+
+    start = time.monotonic()
+    for _ in range(5):
+        cache.get()
+
+    assert time.monotonic() - start < 0.1
+    assert len(calls) == 1
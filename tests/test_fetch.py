@@ -0,0 +1,85 @@
+import time
+
+import pytest
+from benchmarks.stub_feed import StubFeedServer, make_frames
+from modules import fetch
+from modules.fetch import FETCH_STATS, FeedUnavailableError, fetch_feed
+from modules.metrics import STAGE_SECONDS
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    monkeypatch.setattr(fetch, "BACKOFF_BASE", 0)
+    server = StubFeedServer(make_frames(10, 1), period=3600)
+    server.start()
+    yield server
+    server.shutdown()
+
+
+def count_attempts(outcome):
+    counts, _ = STAGE_SECONDS.stages.get(f"fetch_attempt_{outcome}", ([0], 0.0))
+    return sum(counts)
+
+
+def test_server_errors_are_retried(stub_server):
+    url, _ = stub_server.get_urls()
+    stub_server.failing.add("/vehicle_positions.pb")
+    attempts = FETCH_STATS["attempts"]
+    server_errors = count_attempts("server_error")
+
+    with pytest.raises(FeedUnavailableError):
+        fetch_feed(url)
+
+    assert FETCH_STATS["attempts"] - attempts == fetch.MAX_ATTEMPTS
+    assert count_attempts("server_error") - server_errors == fetch.MAX_ATTEMPTS
+
+
+def test_client_errors_are_not_retried(stub_server):
+    url = stub_server.get_urls()[0].replace("vehicle_positions", "missing")
+    attempts = FETCH_STATS["attempts"]
+    client_errors = count_attempts("client_error")
+
+    with pytest.raises(FeedUnavailableError):
+        fetch_feed(url)
+
+    assert FETCH_STATS["attempts"] - attempts == 1
+    assert count_attempts("client_error") - client_errors == 1
+
+
+def test_attempts_are_recorded(stub_server):
+    url, _ = stub_server.get_urls()
+    ok = count_attempts("ok")
+    not_modified = count_attempts("not_modified")
+
+    assert fetch_feed(url)
+    assert fetch_feed(url) is None
+
+    assert count_attempts("ok") - ok == 1
+    assert count_attempts("not_modified") - not_modified == 1
+
+
+def test_attempts_stop_at_the_deadline(monkeypatch, stub_server):
+    monkeypatch.setattr(fetch, "DEADLINE", 1)
+    url, _ = stub_server.get_urls()
+    stub_server.latency["/vehicle_positions.pb"] = 0.4
+    stub_server.failing.add("/vehicle_positions.pb")
+    attempts = FETCH_STATS["attempts"]
+
+    start = time.monotonic()
+    with pytest.raises(FeedUnavailableError):
+        fetch_feed(url)
+
+    assert time.monotonic() - start < 1.3
+    assert FETCH_STATS["attempts"] - attempts < fetch.MAX_ATTEMPTS
+
+
+def test_slow_attempt_is_cut_at_the_deadline(monkeypatch, stub_server):
+    monkeypatch.setattr(fetch, "DEADLINE", 0.5)
+    url, _ = stub_server.get_urls()
+    stub_server.latency["/vehicle_positions.pb"] = 2
+
+    start = time.monotonic()
+    with pytest.raises(FeedUnavailableError):
+        fetch_feed(url)
+
+    assert time.monotonic() - start < 1
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from modules.gtfs_rt_core import (
+    DelayIndex,
+    SnapshotJoiner,
+    decode_delay_feed,
+    decode_snapshot,
+    decode_vehicle_feed,
+    parse_feed,
+)
+
+
+def get_frames(payloads):
+    vehicle_payload, trip_payload = payloads
+    return (
+        decode_vehicle_feed(parse_feed(vehicle_payload)),
+        decode_delay_feed(parse_feed(trip_payload)),
+    )
+
+
+def test_join_before_any_trip_update(payloads):
+    data = decode_snapshot(SnapshotJoiner(), payloads[0], None)
+
+    assert len(data) == 500
+    assert (data["delayCode"] == -1).all()
+    assert data["delay"].isna().all()
+
+
+def test_join_empty_trip_updates(payloads, empty_payload):
+    data = decode_snapshot(SnapshotJoiner(), payloads[0], empty_payload)
+
+    assert len(data) == 500
+    assert (data["delayCode"] == -1).all()
+    assert len(decode_snapshot(SnapshotJoiner(), payloads[0], empty_payload, how="inner")) == 0
+
+
+def test_join_matches_merge(payloads):
+    vehicle_data, delay_data = get_frames(payloads)
+    delay_index = DelayIndex()
+    delay_index.update(delay_data)
+
+    for how in ("left", "inner"):
+        expected = vehicle_data.merge(delay_data, on="tripID", how=how)
+        data = delay_index.join(vehicle_data, how)
+        pd.testing.assert_frame_equal(
+            data.drop(columns="delayCode"),
+            expected.drop(columns="delayCode"),
+            check_dtype=False,
+        )
+        np.testing.assert_array_equal(
+            data["delayCode"], expected["delayCode"].fillna(-1).astype(np.int8)
+        )
+
+
+def test_update_is_incremental(payloads):
+    vehicle_data, delay_data = get_frames(payloads)
+    delay_index = DelayIndex()
+    delay_index.update(delay_data)
+    slots = dict(delay_index.slots)
+
+    # The next regeneration drops a trip and adds a new one
+    dropped = delay_data["tripID"].iloc[0]
+    next_data = delay_data.iloc[1:].copy()
+    next_data.loc[len(delay_data)] = next_data.iloc[0]
+    next_data.loc[len(delay_data), "tripID"] = "new-trip"
+    delay_index.update(next_data)
+
+    assert all(delay_index.slots[trip_id] == slot for trip_id, slot in slots.items())
+    assert delay_index.slots["new-trip"] == len(slots)
+    assert len(delay_index) == len(next_data)
+
+    data = delay_index.join(vehicle_data)
+    assert (data.loc[vehicle_data["tripID"] == dropped, "delayCode"] == -1).all()
@@ -0,0 +1,48 @@
+import cProfile
+
+import pytest
+from modules import feed_cache, metrics
+from modules.feed_cache import FeedCache
+from modules.fetch import FeedUnavailableError
+from modules.metrics import Profiler, render_metrics
+
+
+def test_hit_ratio_is_exported(monkeypatch):
+    cache = FeedCache(lambda: feed_cache.FULL_DF_SCHEMA)
+    # The gauge reads the shared cache
+    monkeypatch.setattr(feed_cache.FEED_CACHE, "stats", cache.stats)
+
+    cache.get()  # miss
+    cache.get()  # hit
+    cache.get()  # hit
+
+    assert cache.hit_ratio() == 2 / 3
+    assert f"rome_in_transit_feed_cache_hit_ratio {2 / 3}" in render_metrics().splitlines()
+
+
+def test_failed_ticks_are_counted():
+    profiler = Profiler()
+    profiler.arm(2)
+
+    for _ in range(2):
+        with pytest.raises(FeedUnavailableError):
+            with profiler.tick():
+                raise FeedUnavailableError("Feed down")
+
+    assert not profiler.active
+    assert "function calls" in profiler.report
+
+
+def test_single_active_profiler(monkeypatch):
+    class ActiveProfile(cProfile.Profile):
+        def enable(self, *args, **kwargs):
+            raise ValueError("Another profiling tool is already active")
+
+    profiler = Profiler()
+    profiler.arm(1)
+    monkeypatch.setattr(metrics.cProfile, "Profile", ActiveProfile)
+
+    with profiler.tick():
+        pass
+
+    assert not profiler.active
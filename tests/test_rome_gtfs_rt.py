@@ -0,0 +1,51 @@
+import time
+
+import pytest
+from benchmarks.stub_feed import StubFeedServer, make_frames
+from modules import fetch, rome_gtfs_rt
+from modules.fetch import FeedUnavailableError
+
+
+@pytest.fixture
+def stub_server():
+    # A single frame for the whole test
+    server = StubFeedServer(make_frames(200, 1), period=3600)
+    server.start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def joiner(monkeypatch):
+    monkeypatch.setattr(fetch, "MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(rome_gtfs_rt, "JOINER", rome_gtfs_rt.SnapshotJoiner())
+
+
+def test_failed_feed_does_not_skip_the_other(stub_server):
+    source = rome_gtfs_rt.HttpFeedSource(stub_server.get_urls())
+
+    stub_server.failing.add("/trip_updates.pb")
+    with pytest.raises(FeedUnavailableError):
+        rome_gtfs_rt.get_data(source)
+
+    # The vehicle positions read by the failed tick are read again
+    stub_server.failing.clear()
+    data = rome_gtfs_rt.get_data(source)
+    assert len(data) == 200
+    assert (data["delayCode"] >= 0).any()
+
+    # Both feeds unchanged
+    assert rome_gtfs_rt.get_data(source) is None
+
+
+def test_feeds_are_fetched_concurrently(stub_server):
+    source = rome_gtfs_rt.HttpFeedSource(stub_server.get_urls())
+    stub_server.latency.update({"/vehicle_positions.pb": 0.5, "/trip_updates.pb": 0.3})
+
+    start = time.perf_counter()
+    data = rome_gtfs_rt.get_data(source)
+    elapsed = time.perf_counter() - start
+
+    assert len(data) == 200
+    # The tick waits for the slowest feed, not for the sum of the latencies
+    assert 0.5 <= elapsed < 0.75
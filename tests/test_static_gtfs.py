@@ -0,0 +1,79 @@
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+from modules.projection import lonlat_to_web_mercator
+from modules.static_gtfs import build_cache, load_static_gtfs
+
+TABLES = {
+    "routes": "route_id,route_short_name,route_long_name\nR64,64,Termini - San Pietro\n",
+    "trips": (
+        "trip_id,route_id,trip_headsign,shape_id\n"
+        "T1,R64,San Pietro,S1\n"
+        "T2,R99,Nowhere,\n"
+    ),
+    "stops": (
+        "stop_id,stop_name,stop_lat,stop_lon\n"
+        "70001,Termini,41.9009,12.5010\n"
+        "70002,San Pietro,41.9022,12.4539\n"
+    ),
+    "stop_times": (
+        "trip_id,stop_id,stop_sequence\n"
+        "T1,70002,2\n"
+        "T1,70001,1\n"
+    ),
+    "shapes": (
+        "shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence\n"
+        "S1,41.9022,12.4539,2\n"
+        "S1,41.9009,12.5010,1\n"
+    ),
+}
+
+
+@pytest.fixture
+def static_gtfs(tmp_path):
+    gtfs_path = tmp_path / "gtfs.zip"
+    with zipfile.ZipFile(gtfs_path, "w") as gtfs_zip:
+        for name, content in TABLES.items():
+            gtfs_zip.writestr(f"{name}.txt", content)
+
+    cache_dir = tmp_path / "static_gtfs"
+    build_cache(str(gtfs_path), str(cache_dir))
+    return load_static_gtfs(str(cache_dir))
+
+
+def test_get_trips(static_gtfs):
+    # Known trip, unknown trip, trip of an unknown route
+    route_names, headsigns = static_gtfs.get_trips(["T1", "T9", "T2"])
+
+    assert route_names.tolist() == ["64", "", ""]
+    assert headsigns.tolist() == ["San Pietro", "", "Nowhere"]
+
+
+def test_get_stop_coords(static_gtfs):
+    x, y = static_gtfs.get_stop_coords(["70001", "79999"])
+
+    expected_x, expected_y = lonlat_to_web_mercator([12.5010], [41.9009])
+    np.testing.assert_allclose([x[0], y[0]], [expected_x[0], expected_y[0]])
+    assert np.isnan(x[1]) and np.isnan(y[1])
+
+
+def test_get_shape(static_gtfs):
+    x, y = static_gtfs.get_shape("T1")
+
+    # Sorted by sequence
+    expected_x, expected_y = lonlat_to_web_mercator([12.5010, 12.4539], [41.9009, 41.9022])
+    np.testing.assert_allclose(x, expected_x)
+    np.testing.assert_allclose(y, expected_y)
+    assert static_gtfs.get_shape("T2") is None
+    assert static_gtfs.get_shape("T9") is None
+
+
+def test_enrich(static_gtfs):
+    data = pd.DataFrame({"vehicleID": ["a", "b"], "tripID": ["T1", "T9"]})
+
+    data = static_gtfs.enrich(data)
+
+    assert data["routeName"].tolist() == ["64", ""]
+    assert data["headsign"].tolist() == ["San Pietro", ""]
@@ -0,0 +1,75 @@
+import gc
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from modules.trails import VehicleTrails
+
+
+def make_snapshot(vehicle_ids, x=0.0, y=0.0):
+    return pd.DataFrame(
+        {
+            "vehicleID": vehicle_ids,
+            "x": np.full(len(vehicle_ids), x),
+            "y": np.full(len(vehicle_ids), y),
+        }
+    )
+
+
+def test_recycle_with_free_slots():
+    trails = VehicleTrails(capacity=4, length=3)
+    trails.append(make_snapshot(["a", "b", "c"]), timestamp=0)
+    # One free slot left: two of the vehicles that left are recycled
+    trails.append(make_snapshot(["d", "e", "f"]), timestamp=10)
+
+    assert {"d", "e", "f"} <= set(trails.slots)
+    assert len(set(trails.slots) & {"a", "b", "c"}) == 1
+    assert trails.stats["recycled"] == 2
+    assert trails.stats["untracked"] == 0
+    assert len(trails.slots) == 4
+
+
+def test_memory_is_bounded_over_a_day():
+    # One simulated day: a tick per minute, the fleet replaced every 2 hours
+    tick_seconds, shift_ticks, n_vehicles = 60, 120, 10
+    rng = np.random.default_rng(0)
+    trails = VehicleTrails(capacity=15, length=5, max_idle=300)
+
+    tracemalloc.start()
+    try:
+        for tick in range(24 * 3600 // tick_seconds):
+            shift = tick // shift_ticks
+            snapshot = make_snapshot([f"{shift}-{i}" for i in range(n_vehicles)])
+            snapshot["x"] = rng.uniform(0, 1000, n_vehicles)
+            trails.append(snapshot, timestamp=tick * tick_seconds)
+            if tick % 10 == 0:
+                trails.get_paths()
+            if tick == 2 * shift_ticks:
+                gc.collect()
+                baseline = tracemalloc.get_traced_memory()[0]
+        gc.collect()
+        growth = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    # Less than 40 bytes per tick (the interpreter caches settle within a few kB)
+    assert growth < 40 * 20 * shift_ticks
+    assert trails.stats["recycled"] > 0
+    assert len(trails.slots) + len(trails.free) == trails.capacity
+
+
+def test_paths_culled_to_box():
+    trails = VehicleTrails(capacity=8, length=3)
+    for step in range(3):
+        trails.append(
+            pd.DataFrame({"vehicleID": ["near", "far"], "x": [step, 1000 + step], "y": [0.0, 0.0]}),
+            timestamp=step,
+        )
+
+    paths = trails.get_paths()
+    assert paths["x"].dtype == np.float32
+    assert np.isfinite(paths["x"]).sum() == 6
+
+    paths = trails.get_paths(box=(-10, -10, 10, 10))
+    np.testing.assert_array_equal(paths["x"][:3], [0, 1, 2])
+    assert np.isfinite(paths["x"]).sum() == 3